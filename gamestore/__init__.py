@@ -0,0 +1 @@
+default_app_config = 'gamestore.apps.GamestoreConfig'
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class GamestoreConfig(AppConfig):
+    name = 'gamestore'
+
+    def ready(self):
+        # Connect the signal receivers
+        from gamestore import signals  # noqa
@@ -0,0 +1,164 @@
+"""Hashed and precompressed static files. collectstatic with CompressedManifestStorage names every file after a hash of
+its content (style.3f2a9c1e4b7d.css) in staticfiles.json, which {% static %} reads, and writes gzip and brotli (if the
+brotli package is installed) variants next to the text files. StaticFiles serves STATIC_ROOT in front of Django: hashed
+files are cached by browsers for a year and the smallest variant that the browser accepts is sent.
+"""
+import gzip
+import io
+import json
+import mimetypes
+import os
+from collections import namedtuple
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files that are worth compressing
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.xml', '.html', '.eot', '.ttf', '.otf', '.ico')
+# A variant is kept only if it is smaller than this part of the original
+MIN_RATIO = 0.95
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+# Content-Encoding and file suffix of the variants, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def gzip_compress(data):
+    # A fixed mtime so that the same file always compresses to the same bytes
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes .gz and .br variants of the hashed text files."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not dry_run and not isinstance(processed, Exception) \
+                    and hashed_name.endswith(COMPRESSIBLE):
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        variants = [('.gz', gzip_compress)]
+        if brotli is not None:
+            variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for suffix, compress in variants:
+            compressed = compress(data)
+            if len(compressed) < len(data) * MIN_RATIO:
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+
+
+# 'variants' maps a Content-Encoding (None for the original) to the path and size of the file
+StaticFile = namedtuple('StaticFile', ('variants', 'content_type', 'cache_control', 'last_modified', 'mtime'))
+
+
+def accepted_encodings(header):
+    """The codings accepted by an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFiles:
+    """WSGI middleware serving the collected static files under STATIC_URL. The files are indexed when the application
+    starts, so run collectstatic before starting the server.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root or settings.STATIC_ROOT
+        self.prefix = prefix or settings.STATIC_URL
+        self.files = self.scan()
+
+    def scan(self):
+        hashed = set()
+        manifest = os.path.join(self.root, CompressedManifestStorage.manifest_name)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                hashed = set(json.load(f).get('paths', {}).values())
+
+        files = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            names = set(filenames)
+            for filename in filenames:
+                if any(filename.endswith(suffix) and filename[:-len(suffix)] in names for coding, suffix in ENCODINGS):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                variants = {None: (path, os.path.getsize(path))}
+                for coding, suffix in ENCODINGS:
+                    if filename + suffix in names:
+                        variants[coding] = (path + suffix, os.path.getsize(path + suffix))
+                mtime = int(os.path.getmtime(path))
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                files[name] = StaticFile(variants, content_type, IMMUTABLE if name in hashed else REVALIDATE,
+                                         formatdate(mtime, usegmt=True), mtime)
+        return files
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+
+        static = self.files.get(path[len(self.prefix):])
+        if static is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return []
+
+        headers = [('Cache-Control', static.cache_control), ('Last-Modified', static.last_modified)]
+        if len(static.variants) > 1:
+            headers.append(('Vary', 'Accept-Encoding'))
+        since = parsedate_tz(environ.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if since is not None and static.mtime <= mktime_tz(since):
+            start_response('304 Not Modified', headers)
+            return []
+
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        coding = next((coding for coding, suffix in ENCODINGS if coding in static.variants and coding in accepted),
+                      None)
+        file_path, size = static.variants[coding]
+        if coding is not None:
+            headers.append(('Content-Encoding', coding))
+        headers += [('Content-Type', static.content_type), ('Content-Length', str(size))]
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        if 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](open(file_path, 'rb'), 65536)
+        return read_file(file_path)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            yield block
@@ -0,0 +1,116 @@
+"""Locks for cached values that are updated in place (leaderboards, score sketches). Updates and rebuilds of the values
+of a lock hold it, so a rebuild never stores a value read from the database before an update that it does not contain.
+An update that cannot get the lock marks the lock missed, and a rebuild running at that time returns its value without
+caching it.
+
+The locks are rows in the local store of the host (see gamestore.localstore), taken in a BEGIN IMMEDIATE transaction,
+because the file based cache has no atomic add. A lock has an owner token, so a process whose lock expired does not
+release the lock of the next owner.
+"""
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from gamestore import localstore
+
+logger = logging.getLogger(__name__)
+
+# How many times and how long (seconds) a process waits for another process to release a lock
+LOCK_ATTEMPTS = 20
+LOCK_WAIT = 0.005
+
+# How long (seconds) a lock is kept by an update and by a rebuild if the process holding it dies
+UPDATE_TIMEOUT = 5
+REBUILD_TIMEOUT = 60
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_lock (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS cache_lock_missed (name TEXT PRIMARY KEY, time REAL NOT NULL)',
+)
+
+# The tokens of the locks held by this thread
+_local = threading.local()
+
+
+def _tokens():
+    if not hasattr(_local, 'tokens'):
+        _local.tokens = {}
+    return _local.tokens
+
+
+def _try_acquire(name, timeout):
+    now = time.time()
+    with localstore.immediate(SCHEMA) as connection:
+        row = connection.execute('SELECT expires FROM cache_lock WHERE name = ?', (name,)).fetchone()
+        if row is not None and row[0] > now:
+            return False
+        token = uuid.uuid4().hex
+        connection.execute('INSERT OR REPLACE INTO cache_lock (name, token, expires) VALUES (?, ?, ?)',
+                           (name, token, now + timeout))
+    _tokens()[name] = token
+    return True
+
+
+def acquire(name, timeout=UPDATE_TIMEOUT):
+    """Take a lock, True if it was taken in time. False if the store fails."""
+    try:
+        for attempt in range(LOCK_ATTEMPTS):
+            if _try_acquire(name, timeout):
+                return True
+            time.sleep(LOCK_WAIT)
+    except sqlite3.Error:
+        logger.exception('Taking the lock %s failed', name)
+    return False
+
+
+def release(name):
+    token = _tokens().pop(name, None)
+    try:
+        localstore.connect(SCHEMA).execute('DELETE FROM cache_lock WHERE name = ? AND token = ?', (name, token))
+    except sqlite3.Error:
+        # The lock expires
+        logger.exception('Releasing the lock %s failed', name)
+
+
+def missed(name):
+    """Note that an update of the values of a lock was skipped because the lock was taken."""
+    try:
+        localstore.connect(SCHEMA).execute('INSERT OR REPLACE INTO cache_lock_missed (name, time) VALUES (?, ?)',
+                                           (name, time.time()))
+    except sqlite3.Error:
+        logger.exception('Marking the lock %s missed failed', name)
+
+
+def _was_missed(name):
+    return localstore.connect(SCHEMA).execute('SELECT 1 FROM cache_lock_missed WHERE name = ?', (name,)).fetchone()
+
+
+def get_or_build(name, key, build, timeout):
+    """Return the cached value of 'key'. A missing value is built and cached while holding the lock 'name', unless an
+    update was missed meanwhile or the lock could not be taken.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    if not acquire(name, REBUILD_TIMEOUT):
+        return build()
+    try:
+        # Another process may have built it while this one waited for the lock
+        value = cache.get(key)
+        if value is None:
+            connection = localstore.connect(SCHEMA)
+            connection.execute('DELETE FROM cache_lock_missed WHERE name = ?', (name,))
+            value = build()
+            if not _was_missed(name):
+                cache.set(key, value, timeout)
+    except sqlite3.Error:
+        logger.exception('Rebuilding %s under the lock %s failed', key, name)
+        if value is None:
+            value = build()
+    finally:
+        release(name)
+    return value
@@ -0,0 +1,56 @@
+"""In-process snapshot of the game catalog. Every worker keeps the games with their developers in memory and reads
+them without queries. The snapshot is rebuilt lazily when the 'games' version stamp changes, which happens whenever a
+Game is saved or deleted in any worker (see gamestore.signals).
+"""
+import threading
+
+from gamestore.models import Game
+from gamestore.replicas import use_primary
+from gamestore.versions import get_stamp
+
+_lock = threading.Lock()
+_catalog = None
+
+
+class Catalog:
+    """An immutable snapshot of all games keyed by pk, name and category. The Game objects are shared between requests
+    and must not be modified; edit a fresh copy from the database instead.
+    """
+
+    def __init__(self, games, stamp):
+        self.stamp = stamp
+        self.games = games
+        self.by_pk = {game.pk: game for game in games}
+        self.by_name = {game.name: game for game in games}
+        self.by_category = {}
+        for game in games:
+            self.by_category.setdefault(game.category, []).append(game)
+
+    def get(self, pk):
+        """Return the game with the given pk. Raises Game.DoesNotExist like Game.objects.get."""
+        try:
+            return self.by_pk[int(pk)]
+        except (KeyError, ValueError):
+            raise Game.DoesNotExist('Game matching query does not exist.')
+
+    def in_category(self, category):
+        return self.by_category.get(category, [])
+
+    @classmethod
+    def load(cls, stamp):
+        # Developer usernames are resolved in the same query. A replica could still miss the change behind the stamp.
+        with use_primary():
+            return cls(list(Game.objects.select_related('developer__user').order_by('pk')), stamp)
+
+
+def get_catalog():
+    """Return the current catalog snapshot, rebuilding it if the games have changed since it was loaded."""
+    global _catalog
+    stamp = get_stamp('games')
+    catalog = _catalog
+    if catalog is None or catalog.stamp != stamp:
+        with _lock:
+            if _catalog is None or _catalog.stamp != stamp:
+                _catalog = Catalog.load(stamp)
+            catalog = _catalog
+    return catalog
@@ -0,0 +1,77 @@
+"""Per session entitlements: the role of the user and the ids of the games the user owns (players) or has added
+(developers). They are loaded once and kept in the session, so ownership checks are set lookups. The session copy is
+reloaded when the 'entitlements:<user id>' version stamp changes, which happens when a game is added to the user's
+owned games or a developer adds or removes a game (see gamestore.signals).
+"""
+from collections import namedtuple
+
+from gamestore.models import Player, Developer, Game
+from gamestore.replicas import use_primary
+from gamestore.versions import get_stamp
+
+SESSION_KEY = 'entitlements'
+
+
+class Entitlements(namedtuple('Entitlements', ('role', 'profile_id', 'games'))):
+    """'role' is 'player', 'developer' or None, 'games' the set of owned or added game ids."""
+
+    @property
+    def is_player(self):
+        return self.role == 'player'
+
+    @property
+    def is_developer(self):
+        return self.role == 'developer'
+
+    def owns(self, game_id):
+        """True if a player owns or a developer has added the game."""
+        return int(game_id) in self.games
+
+
+NONE = Entitlements(None, None, frozenset())
+
+
+def stamp_name(user_id):
+    return 'entitlements:{}'.format(user_id)
+
+
+def load(user):
+    """Load the entitlements of a user from the primary database."""
+    with use_primary():
+        return _load(user)
+
+
+def _load(user):
+    player_id = Player.objects.filter(user=user).values_list('pk', flat=True).first()
+    if player_id is not None:
+        games = Player.owned_games.through.objects.filter(player_id=player_id).values_list('game_id', flat=True)
+        return Entitlements('player', player_id, frozenset(games))
+    developer_id = Developer.objects.filter(user=user).values_list('pk', flat=True).first()
+    if developer_id is not None:
+        games = Game.objects.filter(developer_id=developer_id).values_list('pk', flat=True)
+        return Entitlements('developer', developer_id, frozenset(games))
+    return NONE
+
+
+def get_entitlements(request):
+    """Return the entitlements of the user of the request."""
+    if hasattr(request, '_entitlements'):
+        return request._entitlements
+    if not request.user.is_authenticated:
+        entitlements = NONE
+    else:
+        token = get_stamp(stamp_name(request.user.pk)).token
+        stored = request.session.get(SESSION_KEY)
+        if stored is not None and stored['token'] == token and stored['user_id'] == request.user.pk:
+            entitlements = Entitlements(stored['role'], stored['profile_id'], frozenset(stored['games']))
+        else:
+            entitlements = load(request.user)
+            request.session[SESSION_KEY] = {
+                'token': token,
+                'user_id': request.user.pk,
+                'role': entitlements.role,
+                'profile_id': entitlements.profile_id,
+                'games': sorted(entitlements.games)
+            }
+    request._entitlements = entitlements
+    return entitlements
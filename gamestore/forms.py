@@ -53,10 +53,7 @@ class ScoreForm(forms.Form):
 
 class SaveForm(forms.Form):
     state = forms.CharField(max_length=10000)
-
-
-class RequestLoadForm(forms.Form):
-    request_load = forms.CharField(max_length=255)
+    slot = forms.CharField(max_length=64, required=False)
 
 
 class EditNameForm(forms.Form):
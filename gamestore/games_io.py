@@ -0,0 +1,211 @@
+"""Bulk import and export of games as CSV or JSON lines (one JSON object per line). Both go through the games in chunks,
+so memory use does not grow with the number of games. Imported rows are validated like the add game form. An existing
+game of the row's developer with the same name is updated instead of added, and a row with the name of another
+developer's game is rejected. See the import_games and export_games commands.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from gamestore.entitlements import stamp_name
+from gamestore.forms import GameForm
+from gamestore.models import Developer, Game
+from gamestore.versions import bump
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns of the files, 'developer' is the username of the developer
+FIELDS = ('name', 'category', 'description', 'game_url', 'price', 'developer')
+
+# Key of the error of a row that could not be read
+ERROR = '_error'
+
+# Fields saved by an update of an existing game, found by its name and developer
+UPDATED = ('category', 'description', 'game_url', 'price')
+
+# The model's validators of the fields whose limits are stricter than GameForm's (category length, price digits)
+MODEL_VALIDATORS = [(name, Game._meta.get_field(name).validators) for name in ('category', 'price')]
+
+
+def guess_format(path):
+    for fmt in FORMATS:
+        if path.endswith('.' + fmt):
+            return fmt
+    return None
+
+
+def read_rows(f, fmt):
+    """Yield the line number and the fields of every row of an open file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as error:
+                row = {ERROR: 'Invalid JSON: {}'.format(error)}
+            if not isinstance(row, dict):
+                row = {ERROR: 'Not a JSON object'}
+            yield line, row
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Developers:
+    """Developers by username, loaded as the rows need them."""
+
+    def __init__(self, default=None):
+        self.default = default
+        self.by_username = {}
+
+    def get(self, username):
+        if not username:
+            return self.default
+        if username not in self.by_username:
+            self.by_username[username] = Developer.objects.filter(user__username=username).first()
+        return self.by_username[username]
+
+
+def validate(row, developers):
+    """Return the fields of a game for a row and a list of errors."""
+    if ERROR in row:
+        return None, [row[ERROR]]
+    # The fields of GameForm without a form instance, building one for every row would take most of the import time
+    fields = {}
+    errors = []
+    for name, field in GameForm.base_fields.items():
+        try:
+            fields[name] = field.clean('' if row.get(name) is None else str(row[name]).strip())
+        except ValidationError as error:
+            errors.append('{}: {}'.format(name, ' '.join(error.messages)))
+    if errors:
+        return None, errors
+    for name, validators in MODEL_VALIDATORS:
+        try:
+            for validator in validators:
+                validator(fields[name])
+        except ValidationError as error:
+            errors.append('{}: {}'.format(name, ' '.join(error.messages)))
+    if fields['category'] not in settings.GAME_CATEGORIES:
+        errors.append('category: {} is not one of GAME_CATEGORIES'.format(fields['category']))
+    developer = developers.get(row.get('developer'))
+    if developer is None:
+        errors.append('developer: No developer {}'.format(row.get('developer') or 'given'))
+    fields['developer'] = developer
+    return fields, errors
+
+
+def conflicts(games):
+    """The names of the games of a chunk, given as fields by name, that belong to another developer than the row's."""
+    owners = Game.objects.filter(name__in=games).values_list('name', 'developer_id')
+    return {name for name, developer_id in owners if games[name]['developer'].pk != developer_id}
+
+
+def save_chunk(games):
+    """Add or update the games of a chunk, given as fields by name. A game of another developer is left as it is.
+    Returns the numbers of added and updated games.
+    """
+    with transaction.atomic():
+        existing = dict(Game.objects.filter(name__in=games).values_list('name', 'developer_id'))
+        new = [Game(**fields) for name, fields in games.items() if name not in existing]
+        Game.objects.bulk_create(new)
+        updated = [games[name] for name, developer_id in existing.items()
+                   if games[name]['developer'].pk == developer_id]
+        if updated:
+            update_games(updated)
+
+        # bulk_create and the update send no signals, do what the receivers in signals.py would do
+        bump('games')
+        for user_id in {game.developer.user_id for game in new}:
+            bump(stamp_name(user_id))
+    return len(new), len(updated)
+
+
+def update_games(games):
+    """Update existing games by name and developer with one executemany, an update() for every game is several times
+    slower.
+    """
+    quote = connection.ops.quote_name
+    fields = [Game._meta.get_field(name) for name in UPDATED]
+    sql = 'UPDATE {} SET {} WHERE {} = %s AND {} = %s'.format(
+        quote(Game._meta.db_table), ', '.join('{} = %s'.format(quote(field.column)) for field in fields),
+        quote(Game._meta.get_field('name').column), quote(Game._meta.get_field('developer').column))
+    params = []
+    for game in games:
+        params.append([field.get_db_prep_save(game[field.name], connection) for field in fields] +
+                      [game['name'], game['developer'].pk])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def import_games(rows, developers, report, chunk_size=1000, dry_run=False):
+    """Validate and save the games of (line, row) pairs chunk by chunk. report(line, name, errors) is called for every
+    invalid row and every row with the name of another developer's game. A row overrides earlier rows with the same
+    name. Returns the numbers of added, updated and invalid rows.
+    """
+    added = updated = invalid = 0
+    for chunk in chunked(rows, chunk_size):
+        games = {}
+        lines = {}
+        for line, row in chunk:
+            fields, errors = validate(row, developers)
+            if errors:
+                report(line, row.get('name') or '', errors)
+                invalid += 1
+            else:
+                games[fields['name']] = fields
+                lines[fields['name']] = line
+        for name in sorted(conflicts(games) if games else (), key=lines.get):
+            report(lines[name], name, ['name: A game with this name belongs to another developer'])
+            invalid += 1
+            del games[name]
+        if games and not dry_run:
+            chunk_added, chunk_updated = save_chunk(games)
+            added += chunk_added
+            updated += chunk_updated
+    return added, updated, invalid
+
+
+def export_rows(chunk_size=1000):
+    """Yield the fields of every game in primary key order."""
+    last_pk = 0
+    while True:
+        chunk = list(Game.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', 'name', 'category', 'description', 'game_url', 'price', 'developer__user__username')[:chunk_size])
+        for row in chunk:
+            yield dict(zip(FIELDS, row[1:]))
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1][0]
+
+
+def write_rows(f, fmt, rows):
+    """Write rows to an open file. Returns the number of rows."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+    for row in rows:
+        row['price'] = str(row['price'])
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            f.write(json.dumps(row) + '\n')
+        count += 1
+    return count
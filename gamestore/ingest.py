@@ -0,0 +1,135 @@
+"""Buffered score ingest. Submitted scores are validated in the request and put in an in-process buffer, and a
+background thread writes them with bulk_create when SCORE_INGEST_BATCH_SIZE scores are waiting or
+SCORE_INGEST_FLUSH_INTERVAL seconds have passed. The buffer is flushed when the process exits (atexit and the gunicorn
+worker_exit hook in gunicorn.conf.py), so a graceful shutdown does not lose scores.
+
+A batch that fails is kept for the next flush. After SCORE_INGEST_MAX_ATTEMPTS failures its scores are saved one at a
+time and the scores that still fail (e.g. of a deleted game) are logged and dropped. The buffer holds at most
+SCORE_INGEST_MAX_PENDING scores, more are refused while the database does not take them.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from gamestore.models import HighScore
+from gamestore.signals import scores_added
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreBuffer:
+    """A buffer of unsaved HighScore objects and the thread that saves them."""
+
+    def __init__(self):
+        self.pending = deque()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+        self.pid = None
+
+    def submit(self, scores):
+        """Queue unsaved HighScore objects. The player of a score must have its user loaded. Returns False if the
+        buffer is full and the scores were not queued.
+        """
+        self._ensure_thread()
+        if len(self.pending) + len(scores) > settings.SCORE_INGEST_MAX_PENDING:
+            # The flusher does not keep up, save in the request instead of growing without bound
+            self.flush()
+            if len(self.pending) + len(scores) > settings.SCORE_INGEST_MAX_PENDING:
+                logger.error('Score buffer is full, refused %d scores', len(scores))
+                return False
+        self.pending.extend(scores)
+        if len(self.pending) >= settings.SCORE_INGEST_BATCH_SIZE:
+            self.wake.set()
+        return True
+
+    def flush(self):
+        """Save all queued scores. Returns the number of saved scores."""
+        saved = 0
+        with self.flush_lock:
+            while self.pending:
+                batch = []
+                while self.pending and len(batch) < settings.SCORE_INGEST_BATCH_SIZE:
+                    batch.append(self.pending.popleft())
+                try:
+                    _save(batch)
+                except Exception:
+                    logger.exception('Saving %d scores failed', len(batch))
+                    attempts = getattr(batch[0], 'ingest_attempts', 0) + 1
+                    if attempts < settings.SCORE_INGEST_MAX_ATTEMPTS:
+                        # Keep the scores for the next flush
+                        for score in batch:
+                            score.ingest_attempts = attempts
+                        self.pending.extendleft(reversed(batch))
+                        break
+                    saved += _save_each(batch)
+                    continue
+                saved += len(batch)
+        return saved
+
+    def stop(self):
+        """Stop the flusher thread and save the queued scores."""
+        self.stopped = True
+        self.wake.set()
+        if self.thread is not None and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(settings.SCORE_INGEST_FLUSH_INTERVAL * 2)
+        self.flush()
+
+    def _ensure_thread(self):
+        # Start the flusher on first use in every process, a forked worker does not inherit the thread
+        if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+            with self.start_lock:
+                if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+                    self.pid = os.getpid()
+                    self.stopped = False
+                    self.thread = threading.Thread(target=self._run, name='score-flusher', daemon=True)
+                    self.thread.start()
+
+    def _run(self):
+        try:
+            while not self.stopped:
+                self.wake.wait(settings.SCORE_INGEST_FLUSH_INTERVAL)
+                self.wake.clear()
+                self.flush()
+        finally:
+            connection.close()
+
+
+def _announce(scores):
+    """Send scores_added for committed scores. A failing receiver is logged, the scores are saved anyway."""
+    for receiver, response in scores_added.send_robust(sender=HighScore, scores=scores):
+        if isinstance(response, Exception):
+            logger.error('scores_added receiver %r failed: %r', receiver, response)
+
+
+def _save(scores):
+    with transaction.atomic():
+        HighScore.objects.bulk_create(scores)
+        transaction.on_commit(lambda: _announce(scores))
+
+
+def _save_each(scores):
+    """Save scores one at a time, dropping the ones that fail. Returns the number of saved scores."""
+    saved = 0
+    for score in scores:
+        try:
+            _save([score])
+            saved += 1
+        except Exception:
+            logger.exception('Dropped score %d of player %d in game %d', score.score, score.player_id, score.game_id)
+    return saved
+
+
+buffer = ScoreBuffer()
+atexit.register(buffer.stop)
+
+
+def submit(scores):
+    return buffer.submit(scores)
@@ -0,0 +1,124 @@
+"""Per game top-K leaderboards. A leaderboard holds the best score of the K best players with their usernames, so
+reading it costs O(K) no matter how many scores have been submitted. Leaderboards are kept in the shared cache and
+updated when a HighScore is inserted (see gamestore.signals). A missing leaderboard (cold start, eviction or a deleted
+score) is rebuilt from the HighScore table on the next read.
+
+Every game has an all-time, a weekly and a daily leaderboard. The daily and weekly ones are cached per calendar day
+and week (from Monday) in the local time zone, so a new window starts with a new, empty leaderboard and a rebuild
+only reads the scores of the current window.
+"""
+import datetime
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from gamestore import cachelocks
+from gamestore.models import HighScore
+from gamestore.replicas import use_primary
+
+Entry = namedtuple('Entry', ('score', 'player_id', 'username'))
+
+WINDOWS = ('all', 'week', 'day')
+
+# How long (seconds) the leaderboard of a window is kept, it is not read after the window has passed
+WINDOW_TIMEOUTS = {'all': None, 'week': 8 * 24 * 3600, 'day': 2 * 24 * 3600}
+
+
+def window_start(window, moment=None):
+    """The start of the day or week of 'moment' (default now), None for the all-time window."""
+    if window == 'all':
+        return None
+    zone = timezone.get_default_timezone()
+    day = timezone.localtime(moment or timezone.now(), zone).date()
+    if window == 'week':
+        day -= datetime.timedelta(days=day.weekday())
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()), zone)
+
+
+def window_stamps(window):
+    """The names of the version stamps of a window. A new day or week has a new stamp, so conditional responses of the
+    previous window are not reused.
+    """
+    if window == 'all' or window not in WINDOWS:
+        return []
+    return ['leaderboard-window:{}:{}'.format(window, window_start(window).date().isoformat())]
+
+
+def _key(game_id, window='all', start=None):
+    if window == 'all':
+        return 'leaderboard:{}'.format(game_id)
+    return 'leaderboard:{}:{}:{}'.format(game_id, window, start.date().isoformat())
+
+
+def _lock_name(game_id):
+    return 'leaderboard:{}'.format(game_id)
+
+
+def _sort(entries):
+    return sorted(entries, key=lambda entry: (-entry.score, entry.player_id))
+
+
+def build(game_id, window='all', start=None):
+    """Build the leaderboard of a game from the HighScore table, from the scores since 'start' for a day or week."""
+    highscores = HighScore.objects.filter(game_id=game_id)
+    if window != 'all':
+        highscores = highscores.filter(time__gte=start)
+    rows = highscores \
+        .values('player_id', 'player__user__username') \
+        .annotate(best=Max('score')) \
+        .order_by('-best', 'player_id')[:settings.LEADERBOARD_SIZE]
+    # The cached leaderboard is only updated by new scores, so it must not be built from a lagging replica
+    with use_primary():
+        return [Entry(row['best'], row['player_id'], row['player__user__username']) for row in rows]
+
+
+def get_leaderboard(game_id, window='all'):
+    """Return the leaderboard of a game in a window of WINDOWS as a list of Entry tuples, best first."""
+    start = window_start(window)
+    return cachelocks.get_or_build(_lock_name(game_id), _key(game_id, window, start),
+                                   lambda: build(game_id, window, start), WINDOW_TIMEOUTS[window])
+
+
+def insert(entries, score, player_id, username):
+    """Return the entries with a new score applied. A player keeps only the best score."""
+    for entry in entries:
+        if entry.player_id == player_id:
+            if score <= entry.score:
+                return entries
+            entries = [other for other in entries if other.player_id != player_id]
+            break
+    else:
+        if len(entries) >= settings.LEADERBOARD_SIZE and score <= entries[-1].score:
+            return entries
+    return _sort(entries + [Entry(score, player_id, username)])[:settings.LEADERBOARD_SIZE]
+
+
+def record_score(game_id, player_id, username, score, moment):
+    """Apply a new score saved at 'moment' to the cached leaderboards of a game. A leaderboard is left to be rebuilt
+    on the next read if it is not cached or if another process keeps it locked.
+    """
+    if not cachelocks.acquire(_lock_name(game_id)):
+        invalidate(game_id)
+        return
+
+    try:
+        for window in WINDOWS:
+            key = _key(game_id, window, window_start(window, moment))
+            entries = cache.get(key)
+            if entries is not None:
+                updated = insert(entries, score, player_id, username)
+                if updated is not entries:
+                    cache.set(key, updated, WINDOW_TIMEOUTS[window])
+    finally:
+        cachelocks.release(_lock_name(game_id))
+
+
+def invalidate(game_id):
+    """Drop the cached leaderboards of a game so that they are rebuilt from the table. A rebuild running meanwhile
+    is not cached.
+    """
+    cachelocks.missed(_lock_name(game_id))
+    cache.delete_many([_key(game_id, window, window_start(window)) for window in WINDOWS])
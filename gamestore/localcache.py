@@ -0,0 +1,89 @@
+"""A cache backend that keeps the entries in the local store of the host (see gamestore.localstore), so that all
+gunicorn workers on the host share them. Unlike the file based cache add() is atomic, and culling does not list a
+directory on every write: a small part of the writes delete the expired entries and, above MAX_ENTRIES, the entries
+written longest ago.
+"""
+import pickle
+import random
+import time
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from gamestore import localstore
+
+# Part of the writes that also cull the cache
+CULL_CHANCE = 0.01
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_entry_expires ON cache_entry (expires)',
+)
+
+_LIVE = '(expires IS NULL OR expires > ?)'
+
+
+class LocalStoreCache(BaseCache):
+    """The LOCATION of the cache is not used, the entries are in LOCAL_STORE."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def _expires(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        # The base class gives an absolute time for a timeout and -1 for a value that expires at once
+        return None if timeout is None else max(timeout, 0)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        row = localstore.connect(SCHEMA).execute('SELECT value FROM cache_entry WHERE key = ? AND ' + _LIVE,
+                                                 (self._key(key, version), time.time())).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        localstore.connect(SCHEMA).execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)',
+            (self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with localstore.immediate(SCHEMA) as connection:
+            connection.execute('DELETE FROM cache_entry WHERE key = ? AND NOT ' + _LIVE, (key, time.time()))
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout))).rowcount == 1
+        if added:
+            self._maybe_cull()
+        return added
+
+    def delete(self, key, version=None):
+        localstore.connect(SCHEMA).execute('DELETE FROM cache_entry WHERE key = ?', (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        return localstore.connect(SCHEMA).execute('SELECT 1 FROM cache_entry WHERE key = ? AND ' + _LIVE,
+                                                  (self._key(key, version), time.time())).fetchone() is not None
+
+    def clear(self):
+        localstore.connect(SCHEMA).execute('DELETE FROM cache_entry')
+
+    def _maybe_cull(self):
+        if random.random() < CULL_CHANCE:
+            self.cull()
+
+    def cull(self):
+        """Delete the expired entries and, if there are still MAX_ENTRIES, 1 / CULL_FREQUENCY of the entries written
+        longest ago (all of them if CULL_FREQUENCY is 0).
+        """
+        with localstore.immediate(SCHEMA) as connection:
+            connection.execute('DELETE FROM cache_entry WHERE expires <= ?', (time.time(),))
+            count = connection.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+            if count < self._max_entries:
+                return
+            # INSERT OR REPLACE gives a row a new rowid, so the lowest rowids were written longest ago
+            cull = count // self._cull_frequency if self._cull_frequency else count
+            connection.execute('DELETE FROM cache_entry WHERE rowid IN '
+                               '(SELECT rowid FROM cache_entry ORDER BY rowid LIMIT ?)', (cull,))
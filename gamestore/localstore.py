@@ -0,0 +1,46 @@
+"""A small SQLite database (LOCAL_STORE) outside the main database that all gunicorn workers on a host share. It holds
+the state that must be updated atomically across processes: the cache (gamestore.localcache), the version stamps
+(gamestore.versions), the message limits (gamestore.throttle) and the cache locks (gamestore.cachelocks). Every module
+passes the statements that create its tables, they are run once per connection.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_local = threading.local()
+
+
+def connect(schema=()):
+    """The store connection of this thread, reopened after a fork or a change of LOCAL_STORE."""
+    path = settings.LOCAL_STORE
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.owner != (os.getpid(), path):
+        # Autocommit mode, transactions are started explicitly with BEGIN IMMEDIATE
+        connection = sqlite3.connect(path, timeout=1, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # The state is only caches, limits and locks, losing the last writes in a crash does not matter
+        connection.execute('PRAGMA synchronous=OFF')
+        _local.connection = connection
+        _local.owner = (os.getpid(), path)
+        _local.schemas = set()
+    if schema not in _local.schemas:
+        for statement in schema:
+            connection.execute(statement)
+        _local.schemas.add(schema)
+    return connection
+
+
+@contextmanager
+def immediate(schema=()):
+    """A write transaction that other processes wait for, so a row can be read and written without a lost update."""
+    connection = connect(schema)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+        connection.execute('COMMIT')
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from gamestore import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollups from the paid orders.'
+
+    def handle(self, *args, **options):
+        count = rollups.backfill()
+        self.stdout.write(self.style.SUCCESS('Rebuilt {} daily sales rollups'.format(count)))
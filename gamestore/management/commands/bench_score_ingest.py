@@ -0,0 +1,65 @@
+"""Benchmark of the buffered score ingest endpoint /rest/scores/. Posts score batches to a seeded test database for a
+fixed time and reports the sustained request and score rates, then checks that every accepted score was written. The
+message limits are turned off, they would answer most of the requests with 429.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from gamestore import ingest, seed
+from gamestore.models import HighScore
+
+
+class Command(BaseCommand):
+    help = 'Measures the sustained ingest rate of /rest/scores/ against a seeded test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='How long to submit scores.')
+        parser.add_argument('--batch', type=int, default=10, help='Number of scores in one request.')
+        parser.add_argument('--players', type=int, default=10, help='Number of submitting players.')
+
+    @override_settings(THROTTLE_RATES={})
+    def handle(self, *args, **options):
+        with seed.test_database(players=options['players']) as dataset:
+            clients = []
+            for player in dataset.players:
+                client = Client()
+                client.login(username=player.user.username, password=seed.PASSWORD)
+                games = [game.pk for game in player.owned_games.all()] + \
+                        [game.pk for game in dataset.games if game.price == 0]
+                clients.append((client, games))
+            before = HighScore.objects.count()
+
+            requests = accepted = 0
+            start = time.perf_counter()
+            deadline = start + options['seconds']
+            while time.perf_counter() < deadline:
+                client, games = clients[requests % len(clients)]
+                body = {'scores': [{'game': games[(requests + i) % len(games)], 'score': requests * 7 + i}
+                                   for i in range(options['batch'])]}
+                response = client.post('/rest/scores/', json.dumps(body), content_type='application/json')
+                if response.status_code != 202:
+                    raise CommandError('Submit failed with status {}: {}'.format(response.status_code,
+                                                                                 response.content))
+                accepted += json.loads(response.content.decode('utf-8'))['accepted']
+                requests += 1
+            elapsed = time.perf_counter() - start
+
+            flush_start = time.perf_counter()
+            ingest.buffer.stop()
+            flush_time = time.perf_counter() - flush_start
+            written = HighScore.objects.count() - before
+
+        self.stdout.write(json.dumps({
+            'seconds': round(elapsed, 3),
+            'requests': requests,
+            'requests_per_second': round(requests / elapsed, 1),
+            'scores_accepted': accepted,
+            'scores_per_second': round(accepted / elapsed, 1),
+            'scores_written': written,
+            'final_flush_seconds': round(flush_time, 3)
+        }, indent=2))
+        if written != accepted:
+            raise CommandError('{} accepted scores were not written'.format(accepted - written))
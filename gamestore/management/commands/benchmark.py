@@ -0,0 +1,258 @@
+"""Benchmark of every URL of the gamestore. Run it with
+
+    python manage.py benchmark --output bench.json
+    python manage.py benchmark --baseline bench.json
+
+It seeds a test database (see gamestore.seed and the seed options below) and requests every URL of the query budget
+check (see querybudget) plus the whole purchase flow (buy a game and return from the payment service with a valid
+checksum) from a fixed number of threads. The requests go through the Django request handler in process, so the
+benchmark needs no server or network. On SQLite the requests of routes that write wait for each other. The game
+message limits (THROTTLE_RATES) are off, so that every request runs the view. For every route it reports p50/p95/p99
+latency, throughput and query counts as JSON. With --baseline the results are compared to an earlier report and the
+command fails if a route got slower or runs more queries than the baseline allows.
+"""
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, RegexURLPattern
+
+from gamestore import seed, urls
+from gamestore.management.commands.querybudget import build_checks, check, payment_checksum, \
+    Command as QueryBudget
+from gamestore.models import Developer
+
+# A route is requested with run(client) by a client logged in as user (None for anonymous) and returns the status.
+# 'writes' tells if the route writes to the database.
+Route = namedtuple('Route', ('name', 'user', 'run', 'writes'))
+
+# GET URLs that write to the database
+WRITING_PATHS = ('/buygame/', '/payment/success/')
+
+
+def check_route(c):
+    """A route for a query budget check."""
+    name = '{} {}'.format(c.method.upper(), c.path)
+    if c.user is not None:
+        name += ' (developer)' if isinstance(c.user, Developer) else ' (player)'
+    writes = c.method != 'get' or c.path.startswith(WRITING_PATHS)
+    if c.revalidate:
+        name += ' (revalidated)'
+        etags = {}
+
+        def run(client):
+            # The first request of a client gets the ETag
+            status, etags[client] = QueryBudget.request(client, c, **(
+                {'HTTP_IF_NONE_MATCH': etags[client]} if client in etags else {}))
+            return status
+
+        return Route(name, c.user, run, writes)
+    return Route(name, c.user, lambda client: QueryBudget.request(client, c)[0], writes)
+
+
+def purchase_route(dataset):
+    """A route for the purchase flow: buy a game and return from the payment service with a valid checksum. Every
+    request buys a game that the player does not own yet, taking turns between the players.
+    """
+    purchases = []
+    for player in dataset.players:
+        owned = set(player.owned_games.values_list('pk', flat=True))
+        games = [game for game in dataset.games if game.price > 0 and game.pk not in owned]
+        if games:
+            client = Client()
+            client.force_login(player.user)
+            purchases.append((client, threading.Lock(), iter(games)))
+    turns = itertools.cycle(purchases)
+    lock = threading.Lock()
+
+    def buy(client):
+        with lock:
+            player_client, player_lock, games = next(turns)
+            game = next(games, None)
+        if game is None:
+            raise CommandError('Too few unowned games for the purchase flow, seed more games per category')
+        # A player buys one game at a time
+        with player_lock:
+            response = player_client.get('/buygame/{}/'.format(game.pk))
+            if response.status_code != 200:
+                return response.status_code
+            pid = response.context['pid']
+            query = 'pid={}&ref=1&result=success&checksum={}'.format(pid, payment_checksum(pid, 1, 'success'))
+            return QueryBudget.request(player_client, check('/payment/success/?' + query))[0]
+
+    return Route('GET /buygame/ + /payment/success/ (purchase flow)', None, buy, True)
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values."""
+    rank = int(fraction * len(values) + 0.999999)
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every URL against a seeded test database and compares the results to a baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Measured requests per route.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of threads sending requests.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='Compare to the JSON report in this file.')
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help='Allowed relative p50 and p95 latency increase over the baseline (default 0.5).')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Latency increases smaller than this are never regressions (default 2.0).')
+        parser.add_argument('--games-per-category', type=int, default=4)
+        parser.add_argument('--developers', type=int, default=5)
+        parser.add_argument('--players', type=int, default=100)
+        parser.add_argument('--owned-per-player', type=int, default=5)
+        parser.add_argument('--scores-per-player', type=int, default=20)
+        parser.add_argument('--saves-per-player', type=int, default=5)
+        parser.add_argument('--orders-per-player', type=int, default=5)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        seed_options = {name: options[name] for name in (
+            'games_per_category', 'developers', 'players', 'owned_per_player', 'scores_per_player',
+            'saves_per_player', 'orders_per_player', 'random_seed')}
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        # A database file instead of SQLite's in-memory test database, so that every thread sees the same data
+        database_dir = tempfile.mkdtemp(prefix='gamestore-benchmark-')
+        database_name = os.path.join(database_dir, 'db.sqlite3') if connection.vendor == 'sqlite' else None
+        try:
+            with override_settings(THROTTLE_RATES={}), seed.test_database(database_name, **seed_options) as dataset:
+                checks = build_checks(dataset)
+                self.check_coverage(checks)
+                routes = [check_route(c) for c in checks] + [purchase_route(dataset)]
+                results = {route.name: self.measure(route, options['requests'], options['concurrency'])
+                           for route in routes}
+        finally:
+            shutil.rmtree(database_dir, ignore_errors=True)
+
+        report = {
+            'options': dict(seed_options, requests=options['requests'], concurrency=options['concurrency'],
+                            database=connection.vendor),
+            'routes': results
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if baseline and baseline['options'] != report['options']:
+            self.stdout.write(self.style.WARNING('The baseline was measured with other options: {}'.format(
+                json.dumps(baseline['options'], sort_keys=True))))
+        errors = sorted(name for name, result in results.items() if result['errors'])
+        regressions = self.compare(results, baseline, options) if baseline else []
+        for line in regressions:
+            self.stdout.write(self.style.ERROR('REGRESSION ' + line))
+        if errors:
+            raise CommandError('Requests failed on {}'.format(', '.join(errors)))
+        if regressions:
+            raise CommandError('{} regression(s) against the baseline'.format(len(regressions)))
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    @staticmethod
+    def check_coverage(checks):
+        views = {pattern.callback for pattern in urls.urlpatterns if isinstance(pattern, RegexURLPattern)}
+        missing = views - {resolve(c.path.split('?')[0]).func for c in checks}
+        if missing:
+            raise CommandError('No benchmark for {}'.format(', '.join(sorted(view.__name__ for view in missing))))
+
+    @staticmethod
+    def measure(route, requests, concurrency):
+        """Send 'requests' requests to a route from 'concurrency' threads and return the statistics."""
+        # SQLite has one writer at a time and fails a transaction that would have to wait for another one to upgrade
+        # its read lock, so on SQLite the requests of a writing route wait for each other
+        serial = threading.Lock() if route.writes and connection.vendor == 'sqlite' else None
+
+        # The same clients for the warm up and the measured requests, so that the sessions are warm too
+        clients = [Client() for i in range(concurrency)]
+        if route.user is not None:
+            for client in clients:
+                client.force_login(route.user.user)
+
+        def run_all(count):
+            samples = []
+            failures = []
+            counter = itertools.count()
+            lock = threading.Lock()
+
+            def worker(client):
+                try:
+                    while next(counter) < count:
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            if serial is not None:
+                                with serial:
+                                    status = route.run(client)
+                            else:
+                                status = route.run(client)
+                            elapsed = time.perf_counter() - start
+                        with lock:
+                            samples.append((elapsed, len(queries), status))
+                except Exception as error:
+                    failures.append(error)
+                finally:
+                    # Every thread has its own database connection
+                    connection.close()
+
+            threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if failures:
+                raise failures[0]
+            return samples
+
+        # Every client sends one request first to warm up the caches and its session
+        for client in clients:
+            route.run(client)
+        start = time.perf_counter()
+        samples = run_all(requests)
+        wall = time.perf_counter() - start
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        query_counts = [sample[1] for sample in samples]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[2] >= 400),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'requests_per_second': round(len(samples) / wall, 1),
+            'queries_mean': round(sum(query_counts) / len(query_counts), 2),
+            'queries_max': max(query_counts)
+        }
+
+    @staticmethod
+    def compare(results, baseline, options):
+        """Return a description of every regression against the baseline report."""
+        regressions = []
+        for name, result in sorted(results.items()):
+            before = baseline['routes'].get(name)
+            if before is None:
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                allowed = max(before[key] * (1 + options['threshold']), before[key] + options['min_delta_ms'])
+                if result[key] > allowed:
+                    regressions.append('{}: {} {} ms, baseline {} ms'.format(name, key[:3], result[key], before[key]))
+            if result['queries_max'] > before['queries_max']:
+                regressions.append('{}: {} queries, baseline {}'.format(name, result['queries_max'],
+                                                                        before['queries_max']))
+        return regressions
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gamestore import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Computes the "players also bought" recommendations of every game from the owned games of the players.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=settings.RECOMMENDATIONS_PER_GAME,
+                            help='Recommendations stored per game (default RECOMMENDATIONS_PER_GAME).')
+        parser.add_argument('--block-size', type=int, default=1000,
+                            help='Games whose similarities are computed at a time, lower it to use less memory.')
+
+    def handle(self, *args, **options):
+        if recommendations.np is None:
+            raise CommandError('build_recommendations needs numpy and scipy')
+        games, count = recommendations.build(max(options['top'], 1), max(options['block_size'], 1))
+        self.stdout.write(self.style.SUCCESS('Stored {} recommendations for {} games'.format(count, games)))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gamestore import savestates
+
+
+class Command(BaseCommand):
+    help = 'Drops save states beyond the history depth of every save slot and compresses uncompressed save states.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=settings.SAVE_STATE_HISTORY,
+                            help='Number of states to keep in every slot (default SAVE_STATE_HISTORY).')
+        parser.add_argument('--vacuum', action='store_true', help='Vacuum the database afterwards to reclaim space.')
+
+    def handle(self, *args, **options):
+        deleted, compressed = savestates.compact(max(options['history'], 1))
+        self.stdout.write('Deleted {} old save states, compressed {} save states'.format(deleted, compressed))
+        if options['vacuum']:
+            savestates.vacuum()
+            self.stdout.write('Vacuumed the database')
+        self.stdout.write(self.style.SUCCESS('Save states compacted'))
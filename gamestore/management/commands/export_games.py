@@ -0,0 +1,26 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gamestore import games_io
+
+
+class Command(BaseCommand):
+    help = 'Writes every game to a CSV or JSON lines file that import_games can read.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', default='-', help='The file to write, - for standard output (default).')
+        parser.add_argument('--format', choices=games_io.FORMATS, help='Default from the file extension, else csv.')
+        parser.add_argument('--chunk-size', type=int, default=settings.GAME_IMPORT_CHUNK_SIZE,
+                            help='Games read at a time (default GAME_IMPORT_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or games_io.guess_format(options['file']) or 'csv'
+        rows = games_io.export_rows(max(options['chunk_size'], 1))
+        if options['file'] == '-':
+            games_io.write_rows(sys.stdout, fmt, rows)
+            return
+        with open(options['file'], 'w', newline='', encoding='utf-8') as f:
+            count = games_io.write_rows(f, fmt, rows)
+        self.stdout.write(self.style.SUCCESS('Exported {} games'.format(count)))
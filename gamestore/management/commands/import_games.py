@@ -0,0 +1,65 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gamestore import games_io
+from gamestore.models import Developer
+
+
+class Command(BaseCommand):
+    help = 'Adds or updates games from a CSV or JSON lines file with the columns {}. Games of other developers are ' \
+           'not changed.'.format(', '.join(games_io.FIELDS))
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='The file to import, - for standard input.')
+        parser.add_argument('--format', choices=games_io.FORMATS, help='Default from the file extension.')
+        parser.add_argument('--developer', help='Username of the developer of rows without a developer.')
+        parser.add_argument('--chunk-size', type=int, default=settings.GAME_IMPORT_CHUNK_SIZE,
+                            help='Rows validated and saved at a time (default GAME_IMPORT_CHUNK_SIZE).')
+        parser.add_argument('--errors', help='Write the invalid rows to this CSV file instead of the output.')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the rows.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or games_io.guess_format(options['file'])
+        if fmt is None:
+            raise CommandError('Give --format, the file extension is not one of {}'.format(
+                ', '.join(games_io.FORMATS)))
+        default = None
+        if options['developer']:
+            default = Developer.objects.filter(user__username=options['developer']).first()
+            if default is None:
+                raise CommandError('No developer {}'.format(options['developer']))
+        developers = games_io.Developers(default)
+
+        f = sys.stdin if options['file'] == '-' else open(options['file'], newline='', encoding='utf-8')
+        errors_file = open(options['errors'], 'w', newline='', encoding='utf-8') if options['errors'] else None
+        try:
+            if errors_file is not None:
+                writer = csv.writer(errors_file)
+                writer.writerow(('line', 'name', 'errors'))
+
+                def report(line, name, errors):
+                    writer.writerow((line, name, '; '.join(errors)))
+            else:
+                def report(line, name, errors):
+                    self.stdout.write('Line {} ({}): {}'.format(line, name, '; '.join(errors)))
+
+            added, updated, invalid = games_io.import_games(games_io.read_rows(f, fmt), developers, report,
+                                                            max(options['chunk_size'], 1), options['dry_run'])
+        finally:
+            if f is not sys.stdin:
+                f.close()
+            if errors_file is not None:
+                errors_file.close()
+
+        if options['dry_run']:
+            self.stdout.write('Checked the rows, {} invalid'.format(invalid))
+        else:
+            self.stdout.write('Added {} games, updated {} games, skipped {} invalid rows'.format(
+                added, updated, invalid))
+        if invalid:
+            self.stdout.write(self.style.WARNING('Some rows were invalid'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Games imported'))
@@ -0,0 +1,198 @@
+"""Query budget check for every URL of the gamestore. Run it in CI with
+
+    python manage.py querybudget
+
+It creates a test database, seeds it (see gamestore.seed) and requests every URL in gamestore/urls.py as the right kind
+of user. A URL fails the check if it runs more queries than its budget below or if the query plan of one of its
+SELECT queries does a full scan of a table outside FULL_SCAN_ALLOWED. A view without a check also fails, so a new URL
+needs a budget before it can be merged.
+"""
+import json
+import re
+from collections import namedtuple
+from hashlib import md5
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, RegexURLPattern
+
+from gamestore import seed, urls
+from gamestore.models import Order
+from gamestore.rest import encode_cursor
+
+Check = namedtuple('Check', ('path', 'user', 'max_queries', 'method', 'data', 'revalidate'))
+
+# Tables that are read whole on purpose: the game catalog snapshot and Django's permission tables
+FULL_SCAN_ALLOWED = {'gamestore_game', 'auth_permission', 'django_content_type'}
+
+# Full scans in EXPLAIN output of SQLite ("SCAN TABLE x" before 3.36, "SCAN x" after) and PostgreSQL
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?!.*USING (?:COVERING )?INDEX)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def check(path, user=None, max_queries=0, method='get', data=None, revalidate=False):
+    """With 'revalidate' the measured request sends the ETag of the first response and must get a 304."""
+    return Check(path, user, max_queries, method, data, revalidate)
+
+
+def payment_checksum(pid, ref, result):
+    checksumstr = 'pid={}&ref={}&result={}&token={}'.format(pid, ref, result, settings.SID_SECRET_KEY)
+    return md5(checksumstr.encode('ascii')).hexdigest()
+
+
+def build_checks(dataset):
+    """The requests to measure and their query budgets."""
+    developer = dataset.developers[0]
+    player = dataset.players[0]
+    # The sales checks measure nothing without sales to read
+    sales = Order.objects.filter(seller=developer, status=True).order_by('pk')
+    if not sales.exists() or not developer.sales_rollups.exists():
+        raise CommandError('The seeded developer {} has no sales'.format(developer.user.username))
+    dev_game = sales[0].game
+    owned_game = player.owned_games.order_by('pk')[0]
+    paid_game = [game for game in dataset.games if game.price > 0 and game != owned_game][0]
+    free_game = [game for game in dataset.games if game.price == 0][0]
+    order = player.orders.filter(status=False)[0]
+    success = 'pid={}&ref=1&result=success&checksum={}'.format(order.pk, payment_checksum(order.pk, 1, 'success'))
+
+    return [
+        check('/register/'),
+        check('/register/activate/{}/'.format(player.user_hash), max_queries=2),
+        check('/login/'),
+        check('/logout/'),
+        check('/account/', player, max_queries=3),
+        check('/account/', developer, max_queries=3),
+        check('/account/?limit=2&cursor=' + encode_cursor(owned_game.pk), player, max_queries=3),
+        check('/account/sales/', developer, max_queries=4),
+        check('/account/sales/{}/?period=week'.format(dev_game.pk), developer, max_queries=3),
+        check('/game/{}/'.format(owned_game.pk), player, max_queries=3),
+        check('/game/{}/score/'.format(owned_game.pk), player, max_queries=2, method='post', data={'score': 10}),
+        check('/game/{}/save/'.format(owned_game.pk), player, max_queries=5, method='post',
+              data={'gameState': {'level': 2}}),
+        check('/game/{}/load/'.format(owned_game.pk), player, max_queries=3),
+        check('/'),
+        check('/gamelist/?category=Action'),
+        check('/gamelist/?name=game'),
+        check('/gamelist/?name=gme&category=Action'),
+        check('/gamelist/', player, max_queries=3),
+        check('/gamelist/?name=game', player, max_queries=1, revalidate=True),
+        check('/gamelist/?category=Action&limit=2&cursor=' + encode_cursor(dataset.games[0].pk)),
+        check('/search/autocomplete/?q=seeded ac'),
+        check('/addgame/', developer, max_queries=2),
+        check('/buygame/{}/'.format(paid_game.pk), player, max_queries=3),
+        check('/payment/success/?' + success, player, max_queries=4),
+        check('/payment/cancel/?result=cancel', player, max_queries=2),
+        check('/payment/error/?result=error', player, max_queries=2),
+        check('/highscores/{}/'.format(owned_game.pk)),
+        check('/highscores/{}/'.format(owned_game.pk), revalidate=True),
+        check('/highscores/{}/?window=week'.format(owned_game.pk)),
+        check('/highscores/{}/?window=week'.format(owned_game.pk), revalidate=True),
+        check('/account/edit/name/', player, max_queries=2),
+        check('/account/edit/password/', player, max_queries=2),
+        check('/account/edit/game/{}'.format(dev_game.pk), developer, max_queries=3),
+        check('/rest/'),
+        check('/rest/highscores/?game=' + owned_game.name, max_queries=1),
+        check('/rest/highscores/?leaderboard&game=' + owned_game.name),
+        check('/rest/highscores/?leaderboard&window=day&game=' + owned_game.name),
+        check('/rest/highscores/?window=week&game=' + owned_game.name, max_queries=1),
+        check('/rest/highscores/?score=10&game=' + owned_game.name),
+        check('/rest/highscores/?game=' + owned_game.name, revalidate=True),
+        check('/rest/scores/', player, max_queries=2, method='post',
+              data={'scores': [{'game': owned_game.pk, 'score': 10}, {'game': free_game.pk, 'score': 20}]}),
+        check('/rest/sales/', developer, max_queries=3),
+        check('/rest/sales/?format=csv&status=paid', developer, max_queries=3),
+        check('/rest/sales/rollups/?period=month', developer, max_queries=3),
+        check('/rest/games/'),
+        check('/rest/games/', revalidate=True),
+        check('/metrics/'),
+    ]
+
+
+def full_scans(sql):
+    """Return the tables that the query plan of a SELECT query reads with a full scan."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Make the planner use an index whenever one exists, the seeded tables are too small to need one
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+            plan = [row[0] for row in cursor.fetchall()]
+            cursor.execute('RESET enable_seqscan')
+            return {match.group(1) for line in plan for match in POSTGRES_SCAN.finditer(line)}
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = [row[-1] for row in cursor.fetchall()]
+        return {match.group(1) for match in map(SQLITE_SCAN.match, plan) if match}
+
+
+class Command(BaseCommand):
+    help = 'Checks the query count and the query plans of every URL against a seeded test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sql', action='store_true', help='Print the queries of every request.')
+
+    def handle(self, *args, **options):
+        with seed.test_database() as dataset:
+            failures = self.run_checks(dataset, options['sql'])
+
+        if failures:
+            raise CommandError('{} query budget check(s) failed'.format(failures))
+        self.stdout.write(self.style.SUCCESS('All query budget checks passed'))
+
+    def run_checks(self, dataset, show_sql):
+        checks = build_checks(dataset)
+        failures = 0
+
+        # Every view in urls.py must have a check
+        views = {pattern.callback for pattern in urls.urlpatterns if isinstance(pattern, RegexURLPattern)}
+        for view in views - {resolve(c.path.split('?')[0]).func for c in checks}:
+            self.stdout.write(self.style.ERROR('No query budget for view {}'.format(view.__name__)))
+            failures += 1
+
+        for c in checks:
+            client = Client()
+            if c.user is not None:
+                client.login(username=c.user.user.username, password=seed.PASSWORD)
+            # The first request warms up the caches, the budget is for the steady state
+            status, etag = self.request(client, c)
+            headers = {'HTTP_IF_NONE_MATCH': etag} if c.revalidate and etag else {}
+            with CaptureQueriesContext(connection) as queries:
+                status, etag = self.request(client, c, **headers)
+
+            label = '{} {} ({}{})'.format(c.method.upper(), c.path, c.user.user.username if c.user else 'anonymous',
+                                          ', revalidated' if c.revalidate else '')
+            problems = []
+            if status >= 400 or c.revalidate and status != 304:
+                problems.append('status {}'.format(status))
+            if len(queries) > c.max_queries:
+                problems.append('{} queries, budget {}'.format(len(queries), c.max_queries))
+            for query in queries:
+                if query['sql'].lstrip().upper().startswith('SELECT'):
+                    scans = full_scans(query['sql']) - FULL_SCAN_ALLOWED
+                    if scans:
+                        problems.append('full scan of {}: {}'.format(', '.join(sorted(scans)), query['sql']))
+
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR('FAIL ' + label))
+                for problem in problems:
+                    self.stdout.write('    ' + problem)
+            else:
+                self.stdout.write('ok   {} {} queries'.format(label, len(queries)))
+            if show_sql:
+                for query in queries:
+                    self.stdout.write('    ' + query['sql'])
+        return failures
+
+    @staticmethod
+    def request(client, c, **headers):
+        """Send the request of a check. Returns the status and the ETag of the response."""
+        if c.method == 'post':
+            # The POST endpoints take JSON bodies
+            response = client.post(c.path, json.dumps(c.data), content_type='application/json', **headers)
+        else:
+            response = getattr(client, c.method)(c.path, c.data or {}, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code, response.get('ETag')
@@ -0,0 +1,22 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gamestore import orders
+
+
+class Command(BaseCommand):
+    help = 'Marks pending orders that were not paid in time expired. Run it periodically, e.g. daily.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=settings.ORDER_PENDING_TTL,
+                            help='Expire pending orders older than this many seconds (default ORDER_PENDING_TTL).')
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_REAP_BATCH_SIZE,
+                            help='Orders expired in one transaction (default ORDER_REAP_BATCH_SIZE).')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(seconds=options['ttl'])
+        expired = orders.reap(max(options['batch_size'], 1), before)
+        self.stdout.write(self.style.SUCCESS('Expired {} stale pending orders'.format(expired)))
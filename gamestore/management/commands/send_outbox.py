@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gamestore import outbox
+
+
+class Command(BaseCommand):
+    help = 'Sends the mails waiting in the outbox. Run it with --loop as a worker process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sending until interrupted.')
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Seconds to wait when the outbox is empty (default OUTBOX_POLL_INTERVAL).')
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help='Mails sent over one connection (default OUTBOX_BATCH_SIZE).')
+        parser.add_argument('--backend', default=None,
+                            help='Email backend to send with instead of EMAIL_BACKEND, e.g. '
+                                 'django.core.mail.backends.filebased.EmailBackend.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = outbox.send_batch(options['batch_size'], get_connection(options['backend']))
+            if sent or failed:
+                self.stdout.write('Sent {} mails, {} failed'.format(sent, failed))
+            if not options['loop']:
+                break
+            # A full batch means more mails are probably waiting
+            if sent + failed < options['batch_size']:
+                time.sleep(options['interval'])
+            close_old_connections()
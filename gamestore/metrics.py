@@ -0,0 +1,163 @@
+"""Request metrics in Prometheus format. MetricsMiddleware records, for every view, the request latency, the number and
+total time of SQL queries, the response size and the template render time, and the metrics view exposes them at
+/metrics/. Under gunicorn every worker writes its metrics to PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) and
+/metrics/ adds up the metrics of all workers.
+"""
+import os
+import threading
+import time
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.template.backends.django import DjangoTemplates, Template
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+REQUEST_LATENCY = Histogram('gamestore_request_duration_seconds', 'Request latency', ['view', 'method'],
+                            buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+REQUESTS = Counter('gamestore_requests_total', 'Requests by response status', ['view', 'method', 'status'])
+QUERIES = Histogram('gamestore_request_queries', 'SQL queries per request', ['view'],
+                    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+QUERY_TIME = Histogram('gamestore_request_query_seconds', 'Total time of the SQL queries of a request', ['view'],
+                       buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+RESPONSE_SIZE = Histogram('gamestore_response_bytes', 'Response body size', ['view'],
+                          buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+TEMPLATE_RENDER = Histogram('gamestore_template_render_seconds', 'Template render time', ['template'],
+                            buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1))
+
+# The query counters of the request handled by the current thread
+_local = threading.local()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+def _record_query(seconds):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += seconds
+
+
+class TimedCursor:
+    """Wraps a database cursor and counts the time of its queries."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return self.cursor.execute(*args)
+        finally:
+            _record_query(time.perf_counter() - start)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return self.cursor.executemany(*args)
+        finally:
+            _record_query(time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def _timed(make_cursor):
+    def make_timed_cursor(self, cursor):
+        return make_cursor(self, TimedCursor(cursor))
+    make_timed_cursor.timed = True
+    return make_timed_cursor
+
+
+# Django 1.10 has no hook for running code around queries, so the cursor factories of all database backends are wrapped.
+# A connection_created receiver would be too late for the first cursor of a connection.
+if not getattr(BaseDatabaseWrapper.make_cursor, 'timed', False):
+    BaseDatabaseWrapper.make_cursor = _timed(BaseDatabaseWrapper.make_cursor)
+    BaseDatabaseWrapper.make_debug_cursor = _timed(BaseDatabaseWrapper.make_debug_cursor)
+
+
+class TimedTemplates(DjangoTemplates):
+    """The Django template backend with render times in TEMPLATE_RENDER."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, template.backend)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            TEMPLATE_RENDER.labels(self.origin.template_name or 'string').observe(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """Records the metrics of every request. Should be the first middleware so that its queries are counted too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        start = time.perf_counter()
+        _local.stats = stats
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.stats = None
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+        if response.streaming:
+            # The rows of a streamed response are read while it is sent
+            response.streaming_content = self.stream(response.streaming_content, stats, start, view, request.method)
+        else:
+            self.observe(stats, start, view, request.method, len(response.content))
+        return response
+
+    def stream(self, content, stats, start, view, method):
+        size = 0
+        chunks = iter(content)
+        try:
+            while True:
+                # Count the queries that produce the next chunk
+                _local.stats = stats
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    _local.stats = None
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.observe(stats, start, view, method, size)
+
+    @staticmethod
+    def observe(stats, start, view, method, size):
+        REQUEST_LATENCY.labels(view, method).observe(time.perf_counter() - start)
+        QUERIES.labels(view).observe(stats.queries)
+        QUERY_TIME.labels(view).observe(stats.query_time)
+        RESPONSE_SIZE.labels(view).observe(size)
+
+
+def exposition():
+    """Return the metrics in the Prometheus text format, added up over all workers in multiprocess mode."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
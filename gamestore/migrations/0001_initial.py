@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 17:33
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Developer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activated', models.BooleanField(default=False)),
+                ('user_hash', models.CharField(max_length=255)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='developer', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'permissions': (('developer', 'The user is a developer'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='Game',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('category', models.CharField(max_length=225)),
+                ('description', models.TextField(max_length=500)),
+                ('game_url', models.URLField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('developer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='added_games', to='gamestore.Developer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HighScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='high_scores', to='gamestore.Game')),
+            ],
+            options={
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('purchase_time', models.DateTimeField(auto_now_add=True)),
+                ('status', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Player',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activated', models.BooleanField(default=False)),
+                ('user_hash', models.CharField(max_length=255)),
+                ('owned_games', models.ManyToManyField(to='gamestore.Game')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='player', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'permissions': (('player', 'The user is a player'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='SaveState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(max_length=10000)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saves', to='gamestore.Game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saves', to='gamestore.Player')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='buyer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='gamestore.Player'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='gamestore.Game'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='gamestore.Developer'),
+        ),
+        migrations.AddField(
+            model_name='highscore',
+            name='player',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='high_scores', to='gamestore.Player'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 17:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='developer',
+            name='user_hash',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='player',
+            name='user_hash',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterIndexTogether(
+            name='highscore',
+            index_together=set([('game', 'score')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='order',
+            index_together=set([('game', 'status'), ('seller', 'purchase_time'), ('seller', 'status')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='savestate',
+            index_together=set([('player', 'game', 'id')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 17:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='gamestore.Game')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='gamestore.Developer')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='salesrollup',
+            unique_together=set([('game', 'day')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='salesrollup',
+            index_together=set([('seller', 'day')]),
+        ),
+    ]
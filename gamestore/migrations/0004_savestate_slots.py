@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 17:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0003_salesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savestate',
+            name='data',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='savestate',
+            name='slot',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='savestate',
+            name='state',
+            field=models.CharField(blank=True, max_length=10000),
+        ),
+        migrations.AlterIndexTogether(
+            name='savestate',
+            index_together=set([('player', 'game', 'slot', 'id')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 18:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0006_order_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameRecommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='gamestore.Game')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gamestore.Game')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='gamerecommendation',
+            unique_together=set([('game', 'rank')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 18:21
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0007_gamerecommendation'),
+    ]
+
+    operations = [
+        # The time of the existing scores is not known, they are only on the all-time leaderboards
+        migrations.AddField(
+            model_name='highscore',
+            name='time',
+            field=models.DateTimeField(default=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)),
+        ),
+        migrations.AlterField(
+            model_name='highscore',
+            name='time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterIndexTogether(
+            name='highscore',
+            index_together=set([('game', 'time'), ('game', 'score')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 18:32
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0008_highscore_time'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='highscore',
+            index_together=set([('score', 'id'), ('game', 'score'), ('game', 'time')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 18:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamestore', '0009_highscore_score_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='expired',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='order',
+            index_together=set([('status', 'expired', 'purchase_time'), ('seller', 'purchase_time'), ('seller', 'status'), ('game', 'status')]),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import zlib
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 
 class Developer(models.Model):
@@ -8,7 +11,7 @@ class Developer(models.Model):
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='developer')
     activated = models.BooleanField(default=False)
-    user_hash = models.CharField(max_length=255)
+    user_hash = models.CharField(max_length=255, db_index=True)
 
     @classmethod
     def create(cls, user):
@@ -27,7 +30,7 @@ class Player(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='player')
     owned_games = models.ManyToManyField('Game')
     activated = models.BooleanField(default=False)
-    user_hash = models.CharField(max_length=255)
+    user_hash = models.CharField(max_length=255, db_index=True)
 
     @classmethod
     def create(cls, user):
@@ -50,13 +53,43 @@ class Game(models.Model):
 
 
 class Order(models.Model):
-    """A model for all game purchases. 'status' indicates if the order has been paid or not."""
+    """A model for all game purchases. 'status' indicates if the order has been paid or not, 'expired' that a pending
+    order was not paid in ORDER_PENDING_TTL. An expired order is kept for the payment trail and a late payment callback
+    still pays it.
+    """
     buyer = models.ForeignKey(Player, related_name='orders')
     seller = models.ForeignKey(Developer, related_name='sales')
     game = models.ForeignKey(Game, related_name='orders')
     price = models.DecimalField(max_digits=6, decimal_places=2)
     purchase_time = models.DateTimeField(auto_now_add=True, blank=True)
     status = models.BooleanField(default=False)
+    expired = models.BooleanField(default=False)
+
+    class Meta:
+        # Paid/pending orders of a game (sales page) and of a developer (sales REST API and its exports), stale pending
+        # orders that are not expired yet (reap_orders)
+        index_together = [
+            ('game', 'status'),
+            ('seller', 'status'),
+            ('seller', 'purchase_time'),
+            ('status', 'expired', 'purchase_time'),
+        ]
+
+
+class SalesRollup(models.Model):
+    """Daily sales totals of a game. Updated when an order is paid, so that sales reports never read the orders."""
+    game = models.ForeignKey(Game, related_name='sales_rollups')
+    seller = models.ForeignKey(Developer, related_name='sales_rollups')
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('game', 'day')
+        # Totals of all games of a developer
+        index_together = [
+            ('seller', 'day'),
+        ]
 
 
 class HighScore(models.Model):
@@ -64,13 +97,76 @@ class HighScore(models.Model):
     player = models.ForeignKey(Player, related_name='high_scores')
     game = models.ForeignKey(Game, related_name='high_scores')
     score = models.IntegerField()
+    # Scores saved before the field existed have the time 1970-01-01 and are only on the all-time leaderboards
+    time = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-score']
+        index_together = [
+            # Scores of a game in score order (leaderboards and the high score REST API)
+            ('game', 'score'),
+            # Scores of a game in a time window (daily and weekly leaderboards)
+            ('game', 'time'),
+            # Scores of all games in score order (the high score REST API without a game)
+            ('score', 'id'),
+        ]
 
 
 class SaveState(models.Model):
-    """A model for saving a games state. Used when saving/loading a game."""
+    """A model for saving a games state. Used when saving/loading a game. A player has named save slots for every game
+    and only the latest SAVE_STATE_HISTORY states of a slot are kept (see gamestore.savestates).
+    """
     player = models.ForeignKey(Player, related_name='saves')
     game = models.ForeignKey(Game, related_name='saves')
-    state = models.CharField(max_length=10000)  # save state in json formatted string
+    slot = models.CharField(max_length=64, default='default')
+    data = models.BinaryField(null=True)  # zlib compressed save state in json formatted string
+    state = models.CharField(max_length=10000, blank=True)  # uncompressed save state of old saves
+
+    @property
+    def game_state(self):
+        """The save state as a json formatted string."""
+        if self.data is None:
+            return self.state
+        return zlib.decompress(bytes(self.data)).decode('utf-8')
+
+    class Meta:
+        # The latest save of a slot
+        index_together = [
+            ('player', 'game', 'slot', 'id'),
+        ]
+
+
+class GameRecommendation(models.Model):
+    """A game that owners of 'game' also own, 'rank' 0 being the most similar. Computed offline by the
+    build_recommendations command (see gamestore.recommendations).
+    """
+    game = models.ForeignKey(Game, related_name='recommendations')
+    recommended = models.ForeignKey(Game, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # The recommendations of a game in rank order
+        unique_together = ('game', 'rank')
+
+
+class OutboxMail(models.Model):
+    """An email waiting to be sent. Views store mails in their own transaction and the send_outbox command sends them,
+    so requests do not wait for the mail server (see gamestore.outbox).
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.TextField()  # one address per line
+    created = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    failed = models.BooleanField(default=False)
+
+    class Meta:
+        # Unsent mails that are due
+        index_together = [
+            ('sent', 'failed', 'send_after'),
+        ]
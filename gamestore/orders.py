@@ -0,0 +1,64 @@
+"""Orders of the mockup payment service. A player has at most one pending order per game, which is reused until it is
+paid or ORDER_PENDING_TTL seconds old. Paying an order is one transaction that locks the order, so a replayed or
+concurrent payment callback changes nothing. Pending orders older than the TTL are marked expired by the reap_orders
+command. They are kept, so the payment trail stays complete and a late payment callback still pays the order.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from gamestore import rollups
+from gamestore.models import Order
+
+
+def stale_before():
+    return timezone.now() - datetime.timedelta(seconds=settings.ORDER_PENDING_TTL)
+
+
+def pending_order(player, game):
+    """The player's pending order of the game at its current price, a new one if there is none."""
+    order = Order.objects.filter(buyer=player, game_id=game.pk, status=False, expired=False, price=game.price,
+                                 purchase_time__gte=stale_before()).order_by('-pk').first()
+    if order is None:
+        order = Order.objects.create(buyer=player, seller_id=game.developer_id, game_id=game.pk, price=game.price)
+    return order
+
+
+def finalize_order(order_id, player):
+    """Mark a pending or expired order of the player paid, record the sale and give the player the game. Returns the
+    order or None if the player has no such order. An order that is already paid is returned as it is.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=order_id, buyer=player).first()
+        if order is None or order.status:
+            return order
+        # The time of the payment, a reused order may have been created earlier
+        order.status = True
+        order.expired = False
+        order.purchase_time = timezone.now()
+        # The status condition keeps this idempotent on databases without row locks (SQLite)
+        if not Order.objects.filter(pk=order.pk, status=False).update(status=True, expired=False,
+                                                                        purchase_time=order.purchase_time):
+            return order
+        rollups.record_sale(order)
+        player.owned_games.add(order.game_id)
+    return order
+
+
+def reap(batch_size, before=None):
+    """Mark pending orders created before 'before' (default ORDER_PENDING_TTL ago) expired, batch_size at a time.
+    Returns the number of expired orders.
+    """
+    before = before or stale_before()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Order.objects.filter(status=False, expired=False, purchase_time__lt=before)
+                         .order_by('purchase_time').values_list('pk', flat=True)[:batch_size])
+            if batch:
+                Order.objects.filter(pk__in=batch, status=False).update(expired=True)
+        expired += len(batch)
+        if len(batch) < batch_size:
+            return expired
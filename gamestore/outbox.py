@@ -0,0 +1,78 @@
+"""Email outbox. queue_mail() stores a mail in the OutboxMail table in the current transaction, so the mail exists
+exactly when the data it is about (e.g. a new user) exists. The send_outbox command sends the due mails in batches over
+one mail server connection. A mail that cannot be sent is retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS
+times.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from gamestore.models import OutboxMail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """Store a mail to be sent by the outbox worker. Takes the arguments of django.core.mail.send_mail."""
+    return OutboxMail.objects.create(subject=subject, body=message, from_email=from_email or '',
+                                     to='\n'.join(recipient_list))
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after 'attempts' failed attempts."""
+    return min(settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.OUTBOX_MAX_RETRY_DELAY)
+
+
+def due_mails(batch_size):
+    return list(OutboxMail.objects.filter(sent__isnull=True, failed=False, send_after__lte=timezone.now())
+                .order_by('send_after', 'pk')[:batch_size])
+
+
+def _failed(mail, error):
+    mail.attempts += 1
+    mail.last_error = str(error)
+    if mail.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        mail.failed = True
+        logger.error('Giving up sending mail %d to %s: %s', mail.pk, mail.to.replace('\n', ', '), error)
+    else:
+        mail.send_after = timezone.now() + datetime.timedelta(seconds=retry_delay(mail.attempts))
+        logger.warning('Sending mail %d failed (attempt %d): %s', mail.pk, mail.attempts, error)
+    mail.save(update_fields=['attempts', 'last_error', 'failed', 'send_after'])
+
+
+def send_batch(batch_size=None, connection=None):
+    """Send up to 'batch_size' due mails over one connection. Returns (sent, failed) counts. Run one worker at a time,
+    two workers could send the same mail twice.
+    """
+    mails = due_mails(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not mails:
+        return 0, 0
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as error:
+        # The mail server is unreachable, every mail of the batch waits for a retry
+        for mail in mails:
+            _failed(mail, error)
+        return 0, len(mails)
+
+    sent = failed = 0
+    try:
+        for mail in mails:
+            message = EmailMessage(mail.subject, mail.body, mail.from_email or None, mail.to.split('\n'),
+                                   connection=connection)
+            try:
+                message.send()
+            except Exception as error:
+                _failed(mail, error)
+                failed += 1
+            else:
+                mail.sent = timezone.now()
+                mail.save(update_fields=['sent'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
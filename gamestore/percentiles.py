@@ -0,0 +1,194 @@
+"""Per game score sketches for the rank and percentile of a score among the players of a game ("you beat 93% of the
+players") without counting the HighScore table. A sketch holds the best score of every player of the game in a
+histogram of at most SCORE_SKETCH_BUCKETS buckets with a Fenwick tree over the bucket counts, so the number of players
+below or above a score is found in O(log buckets).
+
+While a game has at most SCORE_SKETCH_BUCKETS distinct best scores every bucket holds one score and the answers are
+exact. Otherwise the buckets are ranges of roughly the same number of players and an answer can be off by the players
+of one bucket. Sketches are kept in the shared cache like the leaderboards, updated when scores are added (see
+gamestore.signals) and rebuilt from the table on the next read when they are missing or once more than
+SCORE_SKETCH_ERROR of their scores were added into ranges that already held other scores. A new best score of a player
+replaces the player's previous best, which is read from the table with one query per game and batch of scores.
+Updates and rebuilds hold the lock of the game's sketch (see gamestore.cachelocks).
+"""
+import bisect
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from gamestore import cachelocks
+from gamestore.models import HighScore
+from gamestore.replicas import use_primary
+
+
+def _key(game_id):
+    return 'score-sketch:{}'.format(game_id)
+
+
+def _lock_name(game_id):
+    return 'score-sketch:{}'.format(game_id)
+
+
+class ScoreSketch:
+    """Bucket i holds the scores in (edges[i - 1], edges[i]], the first bucket all scores up to edges[0]."""
+
+    def __init__(self, edges, counts):
+        self.edges = edges
+        self.counts = counts
+        self.total = sum(counts)
+        # Scores added into a bucket that did not end at them
+        self.inexact = 0
+        self._build_tree()
+
+    def _build_tree(self):
+        """Fenwick tree of the counts, tree[i] is the sum of the counts i - lowbit(i) .. i - 1."""
+        tree = [0] + self.counts
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _prefix(self, n):
+        """The number of scores in the first n buckets."""
+        total = 0
+        while n > 0:
+            total += self.tree[n]
+            n -= n & -n
+        return total
+
+    def _update(self, i, delta):
+        self.counts[i] += delta
+        self.total += delta
+        n = i + 1
+        while n < len(self.tree):
+            self.tree[n] += delta
+            n += n & -n
+
+    def add(self, score):
+        i = bisect.bisect_left(self.edges, score)
+        if i < len(self.edges) and self.edges[i] == score:
+            pass
+        elif len(self.edges) < settings.SCORE_SKETCH_BUCKETS:
+            # A new bucket for a new score, rebuilding the tree is O(buckets)
+            self.edges.insert(i, score)
+            self.counts.insert(i, 0)
+            self._build_tree()
+        else:
+            self.inexact += 1
+            if i == len(self.edges):
+                # Widen the last bucket to the new best score
+                i -= 1
+                self.edges[i] = score
+        self._update(i, 1)
+
+    def remove(self, score):
+        """Remove a score that was added, from the bucket it was added into."""
+        if not self.edges:
+            return
+        self._update(min(bisect.bisect_left(self.edges, score), len(self.edges) - 1), -1)
+
+    @property
+    def stale(self):
+        return self.inexact > self.total * settings.SCORE_SKETCH_ERROR
+
+    def below(self, score):
+        """The number of players whose best score is lower than 'score'."""
+        return self._prefix(bisect.bisect_left(self.edges, score))
+
+    def above(self, score):
+        """The number of players whose best score is higher than 'score'."""
+        return self.total - self._prefix(bisect.bisect_right(self.edges, score))
+
+    def rank(self, score):
+        """The position 'score' would have among the best scores of the players, best first, and the percentage of the
+        players it beats (None if there are no players).
+        """
+        percentile = round(100.0 * self.below(score) / self.total, 1) if self.total else None
+        return self.above(score) + 1, percentile
+
+
+def build(game_id):
+    """Build the sketch of a game from the HighScore table, one query grouped by player."""
+    with use_primary():
+        bests = Counter(HighScore.objects.filter(game_id=game_id).order_by()
+                        .values('player').annotate(best=Max('score')).values_list('best', flat=True))
+    rows = sorted(bests.items())
+    buckets = settings.SCORE_SKETCH_BUCKETS
+    if len(rows) <= buckets:
+        return ScoreSketch([row[0] for row in rows], [row[1] for row in rows])
+
+    # Merge the scores into buckets of about the same size
+    size = sum(row[1] for row in rows) / buckets
+    edges = []
+    counts = []
+    count = 0
+    for score, n in rows:
+        count += n
+        if count >= size and len(edges) < buckets - 1:
+            edges.append(score)
+            counts.append(count)
+            count = 0
+    if count:
+        edges.append(rows[-1][0])
+        counts.append(count)
+    return ScoreSketch(edges, counts)
+
+
+def get_sketch(game_id):
+    """Return the score sketch of a game."""
+    return cachelocks.get_or_build(_lock_name(game_id), _key(game_id), lambda: build(game_id), None)
+
+
+def previous_bests(game_id, scores):
+    """The best score of each player of 'scores' (HighScore objects of one game) in the game before the earliest of
+    their new scores, one query.
+    """
+    before = {}
+    for score in scores:
+        before[score.player_id] = min(before.get(score.player_id, score.time), score.time)
+    if not before:
+        return {}
+    with use_primary():
+        rows = HighScore.objects.filter(game_id=game_id, player_id__in=before, time__lt=min(before.values())) \
+            .order_by().values('player').annotate(best=Max('score')).values_list('player', 'best')
+        return dict(rows)
+
+
+def record_scores(game_id, scores):
+    """Add new scores (HighScore objects) of a game to its cached sketch. A score that is the new best of its player
+    replaces the player's previous best. The sketch is left to be rebuilt on the next read if it is not cached, if
+    another process keeps it locked or if it has become too inexact.
+    """
+    bests = previous_bests(game_id, scores)
+    if not cachelocks.acquire(_lock_name(game_id)):
+        invalidate(game_id)
+        return
+
+    try:
+        sketch = cache.get(_key(game_id))
+        if sketch is not None:
+            for score in sorted(scores, key=lambda score: score.time):
+                best = bests.get(score.player_id)
+                if best is not None and score.score <= best:
+                    continue
+                if best is not None:
+                    sketch.remove(best)
+                sketch.add(score.score)
+                bests[score.player_id] = score.score
+            if sketch.stale:
+                cache.delete(_key(game_id))
+            else:
+                cache.set(_key(game_id), sketch, None)
+    finally:
+        cachelocks.release(_lock_name(game_id))
+
+
+def invalidate(game_id):
+    """Drop the cached sketch of a game so that it is rebuilt from the table. A rebuild running meanwhile is not
+    cached.
+    """
+    cachelocks.missed(_lock_name(game_id))
+    cache.delete(_key(game_id))
@@ -0,0 +1,102 @@
+"""The profile of the logged in user as request.profile. ProfileBackend loads the user with its Player or Developer row
+in one joined query, the query that Django's session authentication makes anyway, so role checks on request.profile
+need no queries of their own (request.user.has_perm() reads the permission tables).
+"""
+from collections import namedtuple
+
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.functional import SimpleLazyObject
+
+BACKEND = 'gamestore.profiles.ProfileBackend'
+
+# The backend saved in the sessions of users who logged in before ProfileBackend
+OLD_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+ROLES = ('player', 'developer')
+
+
+class Profile(namedtuple('Profile', ('role', 'row'))):
+    """'role' is 'player', 'developer' or None, 'row' the Player or Developer object."""
+
+    @property
+    def is_player(self):
+        return self.role == 'player'
+
+    @property
+    def is_developer(self):
+        return self.role == 'developer'
+
+    @property
+    def player(self):
+        return self.row if self.is_player else None
+
+    @property
+    def developer(self):
+        return self.row if self.is_developer else None
+
+    @property
+    def activated(self):
+        return self.row is not None and self.row.activated
+
+
+NONE = Profile(None, None)
+
+
+class ProfileBackend(ModelBackend):
+    """ModelBackend that loads the Player or Developer row together with the user."""
+
+    @staticmethod
+    def users():
+        return auth.get_user_model()._default_manager.select_related(*ROLES)
+
+    def authenticate(self, username=None, password=None, **kwargs):
+        UserModel = auth.get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        user = self.users().filter(**{UserModel.USERNAME_FIELD: username}).first()
+        if user is None:
+            # Hash the password anyway, so that the response time does not tell that the user does not exist
+            UserModel().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        user = self.users().filter(pk=user_id).first()
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def get_profile(user):
+    """The profile of a user. Needs no query if the user was loaded by ProfileBackend."""
+    if not user.is_authenticated:
+        return NONE
+    for role in ROLES:
+        try:
+            return Profile(role, getattr(user, role))
+        except ObjectDoesNotExist:
+            pass
+    return NONE
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        # Switch old sessions to ProfileBackend instead of logging them out
+        if request.session.get(BACKEND_SESSION_KEY) == OLD_BACKEND:
+            request.session[BACKEND_SESSION_KEY] = BACKEND
+        request._cached_user = auth.get_user(request)
+    return request._cached_user
+
+
+class ProfileMiddleware:
+    """Sets request.profile. Replaces the request.user of AuthenticationMiddleware, so it must come right after it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
+        return self.get_response(request)
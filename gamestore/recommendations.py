@@ -0,0 +1,124 @@
+"""'Players also bought' recommendations. The build_recommendations command reads the owned games of all players into a
+sparse player x game matrix, computes the cosine similarity of the game columns (the number of common owners divided
+by the geometric mean of the owner counts) and stores the RECOMMENDATIONS_PER_GAME most similar games of every game in
+the GameRecommendation table. The pages read the recommendations of a game with one indexed query.
+
+Building needs numpy and scipy, reading the recommendations does not.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from gamestore.catalog import get_catalog
+from gamestore.models import GameRecommendation, Player
+from gamestore.versions import bump
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+# Games with fewer common owners are not similar enough to recommend
+MIN_COMMON_OWNERS = 2
+
+# Ownership rows read at a time
+READ_BATCH_SIZE = 100000
+
+
+def recommended_games(game_id):
+    """The games recommended with a game, best first."""
+    by_pk = get_catalog().by_pk
+    pks = GameRecommendation.objects.filter(game_id=game_id).order_by('rank') \
+        .values_list('recommended_id', flat=True)[:settings.RECOMMENDATIONS_SHOWN]
+    return [by_pk[pk] for pk in pks if pk in by_pk]
+
+
+def recommended_for(player_id, owned):
+    """The games recommended for a player who owns the games with the pks in 'owned', best first. The similarities to
+    the RECOMMENDATION_SOURCES games the player got last are added up.
+    """
+    if not owned:
+        return []
+    # The latest owned games table rows of the player, read in the same query
+    sources = Player.owned_games.through.objects.filter(player_id=player_id).order_by('-pk') \
+        .values('game_id')[:settings.RECOMMENDATION_SOURCES]
+    totals = {}
+    for pk, score in GameRecommendation.objects.filter(game_id__in=sources).values_list('recommended_id', 'score'):
+        if pk not in owned:
+            totals[pk] = totals.get(pk, 0) + score
+    by_pk = get_catalog().by_pk
+    pks = sorted((pk for pk in totals if pk in by_pk), key=lambda pk: (-totals[pk], pk))
+    return [by_pk[pk] for pk in pks[:settings.RECOMMENDATIONS_SHOWN]]
+
+
+def read_ownership():
+    """Read the owned games table in primary key order batches. Returns arrays of player ids and game ids."""
+    table = Player.owned_games.through._meta.db_table
+    sql = 'SELECT id, player_id, game_id FROM {} WHERE id > %s ORDER BY id LIMIT %s'.format(
+        connection.ops.quote_name(table))
+    players = []
+    games = []
+    last = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(sql, [last, READ_BATCH_SIZE])
+            rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+            if len(rows):
+                players.append(rows[:, 1])
+                games.append(rows[:, 2])
+                last = int(rows[-1, 0])
+            if len(rows) < READ_BATCH_SIZE:
+                break
+    if not players:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(players), np.concatenate(games)
+
+
+def similar_games(player_ids, game_ids, top, block_size, min_common=MIN_COMMON_OWNERS):
+    """Yield (game ids, recommended game ids, ranks, scores) arrays for blocks of block_size games. Every game gets its
+    'top' most similar games that share at least min_common owners with it.
+    """
+    games, columns = np.unique(game_ids, return_inverse=True)
+    players, rows = np.unique(player_ids, return_inverse=True)
+    owned = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                              shape=(len(players), len(games)))
+    # A row may be in the table twice only if the unique constraint is missing, count an owner once anyway
+    owned.data[:] = 1
+    by_game = owned.T.tocsr()
+    norms = np.sqrt(np.asarray(owned.sum(axis=0), dtype=np.float64).ravel())
+
+    for start in range(0, len(games), block_size):
+        # Common owners of every game in the block with every other game
+        common = (by_game[start:start + block_size] * owned).tocsr()
+        block_rows = np.repeat(np.arange(common.shape[0]) + start, np.diff(common.indptr))
+        other = common.indices
+        keep = (other != block_rows) & (common.data >= min_common)
+        block_rows = block_rows[keep]
+        other = other[keep]
+        scores = common.data[keep] / (norms[block_rows] * norms[other])
+
+        # Sort by game, best score first and then by game id, and keep the first 'top' of every game
+        order = np.lexsort((other, -scores, block_rows))
+        block_rows = block_rows[order]
+        ranks = np.arange(len(order)) - np.searchsorted(block_rows, block_rows)
+        best = ranks < top
+        yield games[block_rows[best]], games[other[order][best]], ranks[best], scores[order][best]
+
+
+@transaction.atomic
+def build(top, block_size):
+    """Replace all recommendations with new ones computed from the owned games. Returns the number of games with
+    recommendations and the number of stored recommendations.
+    """
+    player_ids, game_ids = read_ownership()
+    GameRecommendation.objects.all().delete()
+    recommended = set()
+    count = 0
+    for games, others, ranks, scores in similar_games(player_ids, game_ids, top, block_size):
+        GameRecommendation.objects.bulk_create(
+            GameRecommendation(game_id=int(game), recommended_id=int(other), rank=int(rank), score=float(score))
+            for game, other, rank, score in zip(games, others, ranks, scores))
+        recommended.update(games.tolist())
+        count += len(games)
+    bump('recommendations')
+    return len(recommended), count
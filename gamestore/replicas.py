@@ -0,0 +1,152 @@
+"""Read replicas. Views decorated with read_only run their queries on one of the replica databases in
+DATABASE_REPLICAS, every other query goes to the primary ('default'). A session that has written anything reads from
+the primary for REPLICA_PIN_SECONDS afterwards, so a user always sees their own changes. A replica that fails its
+health check or a query is left out for REPLICA_RETRY_SECONDS and its requests fall back to the primary.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+PRIMARY = 'default'
+
+# Session key holding the time until which the session reads from the primary
+PIN_KEY = 'replica_pin_until'
+
+# Seconds between health checks of a replica that is up
+CHECK_INTERVAL = 5
+
+_local = threading.local()
+# alias -> (healthy, time of the check)
+_health = {}
+
+
+def read_only(view):
+    """Mark a view that only reads, so that its queries can go to a replica."""
+    view.read_only = True
+    return view
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary in the block, e.g. when filling a cache that must not get stale data from a lagging
+    replica.
+    """
+    alias = getattr(_local, 'alias', None)
+    _local.alias = None
+    try:
+        yield
+    finally:
+        _local.alias = alias
+
+
+def mark_down(alias):
+    _health[alias] = (False, time.time())
+
+
+def is_healthy(alias):
+    """Check that a replica answers, at most every CHECK_INTERVAL seconds (REPLICA_RETRY_SECONDS when it is down)."""
+    healthy, checked = _health.get(alias, (False, 0))
+    if time.time() - checked < (CHECK_INTERVAL if healthy else settings.REPLICA_RETRY_SECONDS):
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM gamestore_game LIMIT 1')
+            cursor.fetchall()
+        healthy = True
+    except DatabaseError:
+        connections[alias].close()
+        healthy = False
+    _health[alias] = (healthy, time.time())
+    return healthy
+
+
+def choose_replica():
+    """A random healthy replica or None."""
+    replicas = [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+class ReplicaRouter:
+    """Sends the reads of read_only views to the replica chosen by ReplicaMiddleware and all writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        # Sessions are always read from the primary, a lagging replica could log the user out
+        if model._meta.app_label == 'sessions':
+            return PRIMARY
+        return getattr(_local, 'alias', None) or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'sessions':
+            _local.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Chooses the database of every request. Must come after SessionMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        _local.alias = None
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            alias = _local.alias
+            _local.alias = None
+        if _local.wrote:
+            request.session[PIN_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+        if alias is not None and response.streaming:
+            # The rows of a streamed response are read while it is sent
+            response.streaming_content = self.stream(response.streaming_content, alias)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or not getattr(view_func, 'read_only', False) \
+                or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.COOKIES.get(settings.SESSION_COOKIE_NAME) and request.session.get(PIN_KEY, 0) > time.time():
+            return None
+        _local.alias = choose_replica()
+        request.replica_view = (view_func, view_args, view_kwargs)
+        return None
+
+    def process_exception(self, request, exception):
+        """Run the view again on the primary if the replica failed."""
+        alias = getattr(_local, 'alias', None)
+        if alias is None or not isinstance(exception, DatabaseError):
+            return None
+        mark_down(alias)
+        connections[alias].close()
+        _local.alias = None
+        view_func, view_args, view_kwargs = request.replica_view
+        return view_func(request, *view_args, **view_kwargs)
+
+    @staticmethod
+    def stream(content, alias):
+        chunks = iter(content)
+        while True:
+            _local.alias = alias
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                _local.alias = None
+            yield chunk
@@ -0,0 +1,186 @@
+"""Helpers shared by the RESTful API views: page limits, opaque keyset cursors and streamed JSON, NDJSON and CSV
+responses.
+"""
+import base64
+import csv
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from gamestore.exceptions import BadRequest
+
+# Number of serialized rows joined into one chunk of a streamed response
+STREAM_CHUNK_SIZE = 200
+
+
+def page_limit(request, default=None, maximum=None):
+    """Return the page size requested with the 'limit' GET parameter, capped to 'maximum'. The defaults are
+    REST_PAGE_SIZE and REST_MAX_PAGE_SIZE.
+    """
+    try:
+        limit = int(request.GET.get('limit', default or settings.REST_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    if limit < 1:
+        raise BadRequest('limit must be positive')
+    return min(limit, maximum or settings.REST_MAX_PAGE_SIZE)
+
+
+def parse_time(value):
+    """Parse a 'since'/'until' style GET parameter. Accepts ISO 8601 datetimes and dates (midnight in the current time
+    zone). Naive datetimes are interpreted in the current time zone.
+    """
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise BadRequest('Invalid date: ' + value)
+            moment = datetime.datetime.combine(day, datetime.time())
+    except ValueError:
+        raise BadRequest('Invalid date: ' + value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _cursor_value(value):
+    # DjangoJSONEncoder would truncate datetimes to milliseconds, which breaks keyset comparisons
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return DjangoJSONEncoder().default(value)
+
+
+def encode_cursor(*key):
+    """Encode the sort key of the last returned row into an opaque cursor string."""
+    raw = json.dumps(key, default=_cursor_value)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor created by encode_cursor. The key must have exactly 'size' parts."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise BadRequest('Invalid cursor')
+    if not isinstance(key, list) or len(key) != size:
+        raise BadRequest('Invalid cursor')
+    return key
+
+
+def keyset_after(ordering, key):
+    """Return a Q object matching the rows that come after 'key' in the given ordering, e.g. ('-score', 'pk'). The
+    ordering must be unique (end with the primary key) so that no row is skipped or repeated between pages.
+    """
+    after = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        condition = Q(**{name + ('__lt' if field.startswith('-') else '__gt'): key[i]})
+        for previous, value in zip(ordering[:i], key[:i]):
+            condition &= Q(**{previous.lstrip('-'): value})
+        after |= condition
+    # The same rows, but with a bound on the first field databases can read an index range instead of the OR
+    first = ordering[0]
+    return Q(**{first.lstrip('-') + ('__lte' if first.startswith('-') else '__gte'): key[0]}) & after
+
+
+def iter_keyset(queryset, ordering, key=None, batch_size=None):
+    """Iterate all rows of a values() queryset in keyset ordered batches. Only one batch is held in memory at a time
+    and every batch is an indexed range read instead of an ever growing OFFSET.
+    """
+    batch_size = batch_size or settings.REST_MAX_PAGE_SIZE
+    queryset = queryset.order_by(*ordering)
+    while True:
+        batch = queryset.filter(keyset_after(ordering, key)) if key is not None else queryset
+        rows = list(batch[:batch_size])
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+        key = [rows[-1][field.lstrip('-')] for field in ordering]
+
+
+def iter_page(rows, limit, cursor_for, on_next):
+    """Yield at most 'limit' rows. 'rows' should hold one extra row: if it exists there is a next page and its cursor
+    (built from the last yielded row with cursor_for) is passed to on_next.
+    """
+    last = None
+    for count, row in enumerate(rows):
+        if count == limit:
+            on_next(cursor_for(last))
+            return
+        last = row
+        yield row
+
+
+def json_page_response(rows, limit, serialize, cursor_for):
+    """Stream a page of rows as {"results": [...], "next": cursor}. Rows are serialized one at a time so the memory
+    use does not depend on the size of the page or the table.
+    """
+    def generate():
+        state = {'next': None}
+
+        def set_next(cursor):
+            state['next'] = cursor
+
+        yield '{"results": ['
+        chunk = []
+        first = True
+        for row in iter_page(rows, limit, cursor_for, set_next):
+            chunk.append(json.dumps(serialize(row), cls=DjangoJSONEncoder))
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ('' if first else ', ') + ', '.join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield ('' if first else ', ') + ', '.join(chunk)
+        yield '], "next": ' + json.dumps(state['next']) + '}'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
+
+
+def ndjson_response(rows, serialize):
+    """Stream rows as newline delimited JSON, one object per line."""
+    def generate():
+        chunk = []
+        for row in rows:
+            chunk.append(json.dumps(serialize(row), cls=DjangoJSONEncoder) + '\n')
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    return StreamingHttpResponse(generate(), content_type='application/x-ndjson')
+
+
+class _Echo:
+    """A file-like object for csv.writer that returns the written line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+def csv_response(rows, header, serialize, filename):
+    """Stream rows as a CSV attachment. 'serialize' turns a row into a list of values in the order of 'header'."""
+    writer = csv.writer(_Echo())
+
+    def generate():
+        yield writer.writerow(header)
+        chunk = []
+        for row in rows:
+            chunk.append(writer.writerow(serialize(row)))
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
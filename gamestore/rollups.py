@@ -0,0 +1,69 @@
+"""Sales rollups: daily units and revenue per game in the SalesRollup table. A rollup row is updated when an order is
+paid, so sales reports read one row per day instead of every order. Days are in the default time zone (TIME_ZONE).
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from gamestore.models import Order, SalesRollup
+
+PERIODS = ('day', 'week', 'month')
+
+
+def sale_day(moment):
+    return timezone.localtime(moment, timezone.get_default_timezone()).date()
+
+
+def record_sale(order):
+    """Add a paid order to the rollup of its game and day. Call it in the transaction that marks the order paid."""
+    day = sale_day(order.purchase_time)
+    rollups = SalesRollup.objects.filter(game_id=order.game_id, day=day)
+    if rollups.update(units=F('units') + 1, revenue=F('revenue') + order.price):
+        return
+    try:
+        with transaction.atomic():
+            SalesRollup.objects.create(game_id=order.game_id, seller_id=order.seller_id, day=day, units=1,
+                                       revenue=order.price)
+    except IntegrityError:
+        # Another request created the row first
+        rollups.update(units=F('units') + 1, revenue=F('revenue') + order.price)
+
+
+@transaction.atomic
+def backfill():
+    """Rebuild all rollups from the paid orders. Returns the number of rollup rows."""
+    SalesRollup.objects.all().delete()
+    with timezone.override(timezone.get_default_timezone()):
+        days = Order.objects.filter(status=True) \
+            .annotate(day=TruncDate('purchase_time')) \
+            .values('game_id', 'seller_id', 'day') \
+            .annotate(units=Count('pk'), revenue=Sum('price')) \
+            .order_by()
+        rollups = [SalesRollup(game_id=row['game_id'], seller_id=row['seller_id'], day=row['day'], units=row['units'],
+                               revenue=row['revenue']) for row in days]
+    SalesRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def report(rollups, period='day'):
+    """Sum a SalesRollup queryset into periods ('day', 'week' starting on Monday or 'month'). Returns a list of
+    {'period', 'units', 'revenue'} dicts, latest first. The database sums one row per day of all selected games.
+    """
+    totals = {}
+    for row in rollups.values('day').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by():
+        start = period_start(row['day'], period)
+        total = totals.setdefault(start, {'period': start, 'units': 0, 'revenue': 0})
+        total['units'] += row['units']
+        total['revenue'] += row['revenue']
+    return sorted(totals.values(), key=lambda total: total['period'], reverse=True)
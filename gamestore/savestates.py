@@ -0,0 +1,77 @@
+"""Save slots. Every SAVE message stores a zlib compressed state in a named slot of the player and game and drops the
+states older than the SAVE_STATE_HISTORY latest ones of the slot. A load reads the latest row of the slot through the
+(player, game, slot, id) index.
+"""
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from gamestore.models import SaveState
+
+DEFAULT_SLOT = 'default'
+
+
+def compress(state):
+    return zlib.compress(state.encode('utf-8'), 9)
+
+
+def _slot(player, game, slot):
+    return SaveState.objects.filter(player=player, game=game, slot=slot or DEFAULT_SLOT)
+
+
+@transaction.atomic
+def save_state(player, game, state, slot=None):
+    """Store a json formatted state in a save slot and drop the states beyond the history depth of the slot."""
+    saved = SaveState.objects.create(player=player, game=game, slot=slot or DEFAULT_SLOT, data=compress(state))
+    oldest_kept = _slot(player, game, slot).order_by('-pk').values_list('pk', flat=True)[
+        settings.SAVE_STATE_HISTORY - 1:settings.SAVE_STATE_HISTORY]
+    _slot(player, game, slot).filter(pk__lt=oldest_kept).delete()
+    return saved
+
+
+def load_state(player, game, slot=None):
+    """Return the latest json formatted state of a save slot or None if the slot is empty."""
+    save = _slot(player, game, slot).order_by('-pk').only('data', 'state').first()
+    return save.game_state if save is not None else None
+
+
+def compact(history=None, batch_size=1000):
+    """Drop the states beyond the history depth of every slot and compress the states stored uncompressed. Returns
+    (number of deleted states, number of compressed states).
+    """
+    history = history or settings.SAVE_STATE_HISTORY
+    deleted = 0
+    full_slots = SaveState.objects.values('player_id', 'game_id', 'slot') \
+        .annotate(count=Count('pk')).filter(count__gt=history).order_by()
+    for group in full_slots.iterator():
+        with transaction.atomic():
+            states = _slot(group['player_id'], group['game_id'], group['slot'])
+            oldest_kept = states.order_by('-pk').values_list('pk', flat=True)[history - 1:history]
+            deleted += states.filter(pk__lt=oldest_kept).delete()[0]
+
+    compressed = 0
+    last_pk = 0
+    while True:
+        rows = list(SaveState.objects.filter(data__isnull=True, pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'state')[:batch_size])
+        if not rows:
+            break
+        with transaction.atomic():
+            for pk, state in rows:
+                SaveState.objects.filter(pk=pk).update(data=compress(state), state='')
+        compressed += len(rows)
+        last_pk = rows[-1][0]
+    return deleted, compressed
+
+
+def vacuum():
+    """Give the space of the deleted and compressed states back to the database file (SQLite) or the table
+    (PostgreSQL). Must not run inside a transaction.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('VACUUM ANALYZE ' + connection.ops.quote_name(SaveState._meta.db_table))
+        elif connection.vendor == 'sqlite':
+            cursor.execute('VACUUM')
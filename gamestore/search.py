@@ -0,0 +1,154 @@
+"""In-memory ranked search over the game catalog. Game names and descriptions are split into words and the words are
+indexed by their trigrams, so prefixes and misspelled words still find the game. The index is built from the catalog
+snapshot (see gamestore.catalog) and rebuilt whenever the snapshot changes, so it works the same on every database.
+"""
+import bisect
+import re
+import threading
+
+from gamestore.catalog import get_catalog
+
+# Weight of a word found in the name and in the description of a game
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+# Extra score for a game whose name contains the whole query
+PHRASE_BONUS = 2.0
+# Minimum trigram similarity for a misspelled word to match
+SIMILARITY_THRESHOLD = 0.3
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+_lock = threading.Lock()
+_index = None
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def trigrams(word):
+    """The trigrams of a word padded like in PostgreSQL pg_trgm, e.g. 'cat': '  c', ' ca', 'cat', 'at '."""
+    padded = '  ' + word + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Trigram index of the words of one catalog snapshot."""
+
+    def __init__(self, catalog):
+        self.stamp = catalog.stamp
+        self.catalog = catalog
+        # word -> {game pk: weight}
+        self.postings = {}
+        # trigram -> set of words
+        self.words_by_trigram = {}
+        # word -> trigrams of the word
+        self.word_trigrams = {}
+        # Sorted (word of a name, lower case name, pk) for autocomplete
+        self.name_words = []
+
+        for game in catalog.games:
+            for weight, text in ((NAME_WEIGHT, game.name), (DESCRIPTION_WEIGHT, game.description)):
+                for word in tokenize(text):
+                    games = self.postings.setdefault(word, {})
+                    games[game.pk] = max(games.get(game.pk, 0), weight)
+            for word in set(tokenize(game.name)):
+                self.name_words.append((word, game.name.lower(), game.pk))
+        self.name_words.sort()
+
+        # Browsing without a query: the games of all categories and of every category in catalog order with their
+        # sort keys, so that a page is found by bisecting the keys
+        self.browse = {None: (catalog.games, [(game.pk,) for game in catalog.games])}
+        for category, games in catalog.by_category.items():
+            self.browse[category] = (games, [(game.pk,) for game in games])
+        self.browse_facets = sorted((category, len(games)) for category, games in catalog.by_category.items())
+
+        for word in self.postings:
+            grams = trigrams(word)
+            self.word_trigrams[word] = grams
+            for gram in grams:
+                self.words_by_trigram.setdefault(gram, set()).add(word)
+
+    def similar_words(self, word):
+        """Return {indexed word: similarity} for the words that match a query word by prefix or by trigrams."""
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for candidate in self.words_by_trigram.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        matches = {}
+        for candidate, count in shared.items():
+            if candidate.startswith(word):
+                similarity = 1.0 if candidate == word else 0.9
+            else:
+                similarity = count / len(grams | self.word_trigrams[candidate])
+            if similarity >= SIMILARITY_THRESHOLD:
+                matches[candidate] = similarity
+        return matches
+
+    def search(self, query, category=None):
+        """Return (games, keys, facets). 'games' are the games matching the query, best first, and limited to
+        'category' if it is given. 'keys' are the ascending sort keys of the games, (-score, pk) for a query and (pk,)
+        without one. 'facets' are (category, number of matching games) pairs for all categories with matches.
+        Without a query all games match in catalog order.
+        """
+        words = tokenize(query or '')
+        if not words:
+            games, keys = self.browse.get(category or None, ([], []))
+            return games, keys, self.browse_facets
+
+        scores = {}
+        for word in words:
+            best = {}
+            for candidate, similarity in self.similar_words(word).items():
+                for pk, weight in self.postings[candidate].items():
+                    best[pk] = max(best.get(pk, 0), similarity * weight)
+            for pk, score in best.items():
+                scores[pk] = scores.get(pk, 0) + score
+        phrase = ' '.join(words)
+        for pk in scores:
+            if phrase in self.catalog.by_pk[pk].name.lower():
+                scores[pk] += PHRASE_BONUS
+        keys = sorted((-score, pk) for pk, score in scores.items())
+
+        facets = {}
+        for key in keys:
+            game_category = self.catalog.by_pk[key[1]].category
+            facets[game_category] = facets.get(game_category, 0) + 1
+        if category:
+            keys = [key for key in keys if self.catalog.by_pk[key[1]].category == category]
+        return [self.catalog.by_pk[key[1]] for key in keys], keys, sorted(facets.items())
+
+    def autocomplete(self, prefix, limit=10):
+        """Return up to 'limit' game names that have a word starting with 'prefix'."""
+        words = tokenize(prefix)
+        if not words:
+            return []
+        # Complete the last word, the earlier words must appear in the name
+        last = words[-1]
+        start = bisect.bisect_left(self.name_words, (last,))
+        names = []
+        seen = set()
+        for i in range(start, len(self.name_words)):
+            word, lower_name, pk = self.name_words[i]
+            if not word.startswith(last):
+                break
+            if pk not in seen and all(earlier in lower_name for earlier in words[:-1]):
+                seen.add(pk)
+                names.append(self.catalog.by_pk[pk].name)
+                if len(names) == limit * 10:
+                    break
+        return sorted(names, key=lambda name: (not name.lower().startswith(prefix.lower()), name))[:limit]
+
+
+def get_index():
+    """Return the search index of the current catalog snapshot."""
+    global _index
+    catalog = get_catalog()
+    index = _index
+    if index is None or index.stamp != catalog.stamp:
+        with _lock:
+            if _index is None or _index.stamp != catalog.stamp:
+                _index = SearchIndex(catalog)
+            index = _index
+    return index
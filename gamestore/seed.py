@@ -0,0 +1,135 @@
+"""A synthetic dataset for the query budget check and the benchmarks. All rows are inserted with bulk_create, so
+seeding a large dataset takes seconds. Seeded users share the password PASSWORD.
+"""
+import datetime
+import os
+import random
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+from decimal import Decimal
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Permission
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from gamestore import rollups, savestates
+from gamestore.models import Player, Developer, Game, HighScore, Order, SaveState
+
+PASSWORD = 'seeded-password'
+
+Dataset = namedtuple('Dataset', ('developers', 'players', 'games'))
+
+
+def _create_users(prefix, count, codename, password):
+    User.objects.bulk_create(
+        User(username='{}{}'.format(prefix, i), password=password, email='{}{}@example.com'.format(prefix, i))
+        for i in range(count))
+    users = list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+    permission = Permission.objects.get(codename=codename)
+    User.user_permissions.through.objects.bulk_create(
+        User.user_permissions.through(user_id=user.pk, permission_id=permission.pk) for user in users)
+    return users
+
+
+def _user_hash(user):
+    return md5(user.username.encode('ascii')).hexdigest()
+
+
+@transaction.atomic
+def seed(games_per_category=2, developers=2, players=20, owned_per_player=3, scores_per_player=5,
+         saves_per_player=2, orders_per_player=3, random_seed=0):
+    """Insert activated developers and players, games in every category of GAME_CATEGORIES, owned games, scores, save
+    states and orders (paid ones for the owned games and one pending order per player) with their sales rollups.
+    Returns a Dataset.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+
+    dev_users = _create_users('seed-developer-', developers, 'developer', password)
+    Developer.objects.bulk_create(Developer(user=user, activated=True, user_hash=_user_hash(user)) for user in dev_users)
+    developer_list = list(Developer.objects.filter(user__in=dev_users).select_related('user').order_by('pk'))
+
+    player_users = _create_users('seed-player-', players, 'player', password)
+    Player.objects.bulk_create(Player(user=user, activated=True, user_hash=_user_hash(user)) for user in player_users)
+    player_list = list(Player.objects.filter(user__in=player_users).select_related('user').order_by('pk'))
+
+    games = []
+    for n, category in enumerate(settings.GAME_CATEGORIES):
+        for i in range(games_per_category):
+            # The developers get the games in turn and every fourth game of a developer is free to play, so that every
+            # developer has paid games and sales
+            k = n * games_per_category + i
+            games.append(Game(name='Seeded {} game {}'.format(category, i), category=category,
+                              description='A seeded {} game number {} for testing.'.format(category.lower(), i),
+                              game_url='http://example.com/games/{}/{}/'.format(category.lower(), i),
+                              price=Decimal(0) if k // len(developer_list) % 4 == 0 else
+                              Decimal(rng.randint(100, 2000)) / 100,
+                              developer=developer_list[k % len(developer_list)]))
+    Game.objects.bulk_create(games)
+    game_list = list(Game.objects.filter(name__startswith='Seeded ').order_by('pk'))
+    paid_games = [game for game in game_list if game.price > 0]
+
+    owned = []
+    scores = []
+    saves = []
+    orders = []
+    now = timezone.now()
+    for player in player_list:
+        owned_games = rng.sample(paid_games, min(owned_per_player, len(paid_games)))
+        owned.extend(Player.owned_games.through(player_id=player.pk, game_id=game.pk) for game in owned_games)
+        for i in range(orders_per_player):
+            game = owned_games[i % len(owned_games)] if owned_games else rng.choice(game_list)
+            orders.append(Order(buyer=player, seller_id=game.developer_id, game=game, price=game.price, status=True))
+        if paid_games:
+            game = rng.choice(paid_games)
+            orders.append(Order(buyer=player, seller_id=game.developer_id, game=game, price=game.price))
+        playable = owned_games + [game for game in game_list if game.price == 0]
+        for i in range(scores_per_player):
+            # Spread over the last 30 days for the daily and weekly leaderboards
+            scores.append(HighScore(player=player, game=rng.choice(playable), score=rng.randint(0, 100000),
+                                    time=now - datetime.timedelta(seconds=rng.randint(0, 30 * 24 * 3600))))
+        for i in range(saves_per_player):
+            state = '{{"level": {}, "position": [{}, {}]}}'.format(i, rng.random(), rng.random())
+            saves.append(SaveState(player=player, game=rng.choice(playable), data=savestates.compress(state)))
+
+    Player.owned_games.through.objects.bulk_create(owned)
+    Order.objects.bulk_create(orders)
+    HighScore.objects.bulk_create(scores)
+    SaveState.objects.bulk_create(saves)
+    rollups.backfill()
+
+    return Dataset(developer_list, player_list, game_list)
+
+
+@contextmanager
+def test_database(database_name=None, **options):
+    """Create a test database with a seeded dataset (see seed for the options) for the duration of the block and yield
+    the Dataset. 'database_name' overrides the test database name, e.g. a file for SQLite so that the database is shared
+    by threads. The block gets its own in-process cache and game message limiter store so that the shared ones of the
+    running site are not touched, and does not use the read replicas.
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if database_name:
+        test_settings['NAME'] = database_name
+    store_dir = tempfile.mkdtemp(prefix='gamestore-local-')
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                           DATABASE_REPLICAS=[], LOCAL_STORE=os.path.join(store_dir, 'local.sqlite3')):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield seed(**options)
+        finally:
+            # Write buffered scores before the database goes away
+            from gamestore import ingest
+            ingest.buffer.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+            shutil.rmtree(store_dir, ignore_errors=True)
+            teardown_test_environment()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 """
 
 import os
+import tempfile
 try:
     import gamestore.mailconfig as cf
 except:
@@ -48,10 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gamestore.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gamestore.profiles.ProfileMiddleware',
+    'gamestore.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -60,9 +64,12 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'gamestore.urls'
 
+# Loads the Player or Developer profile with the user (see gamestore.profiles)
+AUTHENTICATION_BACKENDS = ['gamestore.profiles.ProfileBackend']
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'gamestore.metrics.TimedTemplates',
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -89,6 +96,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# The cache is shared by all worker processes on the same host, so it must not be a per process cache (LocMemCache).
+# It is kept in LOCAL_STORE (see gamestore.localcache) rather than in files: the file based cache lists its directory
+# on every write to decide whether to cull, and its add() is not atomic. The cache only holds values that are rebuilt
+# when missing (leaderboards, score sketches, pages). The version stamps and the locks, which must not be evicted or
+# taken twice, are separate tables in LOCAL_STORE that are never culled (see gamestore.versions, gamestore.cachelocks).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'gamestore.localcache.LocalStoreCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 
@@ -170,6 +193,31 @@ if "DYNO" in os.environ:
     DEBUG = False # False, once service is succesfully deployed
     ALLOWED_HOSTS = ['*']
 
+    # Hashed and precompressed static files, built by collectstatic and served by gamestore.assets.StaticFiles
+    STATICFILES_STORAGE = 'gamestore.assets.CompressedManifestStorage'
+
+# Read replicas for the read only views (see gamestore.replicas). GAMESTORE_REPLICAS is a comma separated list of
+# database URLs or paths of SQLite files, e.g. a copy of db.sqlite3 for trying it locally.
+DATABASE_REPLICAS = []
+for url in filter(None, os.environ.get('GAMESTORE_REPLICAS', '').split(',')):
+    alias = 'replica{}'.format(len(DATABASE_REPLICAS) + 1)
+    if '://' in url:
+        import dj_database_url
+        DATABASES[alias] = dj_database_url.parse(url)
+    else:
+        # Read only, and an error instead of a new empty database if the file is missing
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'file:{}?mode=ro'.format(os.path.abspath(url)),
+            'OPTIONS': {'uri': True},
+        }
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['gamestore.replicas.ReplicaRouter']
+# Seconds a session reads from the primary after writing, and seconds before a failed replica is tried again
+REPLICA_PIN_SECONDS = 10
+REPLICA_RETRY_SECONDS = 30
+
 # Game categories for global variable
 GAME_CATEGORIES = [
     '3D',
@@ -188,3 +236,75 @@ GAME_CATEGORIES = [
     'Sports',
     'Strategy',
 ]
+
+# RESTful API page sizes (the 'limit' GET parameter)
+REST_PAGE_SIZE = 100
+REST_MAX_PAGE_SIZE = 1000
+
+# Games on a page of the game list and the account page, the 'limit' GET parameter can ask for up to the maximum
+GAME_PAGE_SIZE = 24
+GAME_MAX_PAGE_SIZE = 100
+
+# "Players also bought" recommendations (see gamestore.recommendations): stored per game by build_recommendations,
+# shown on a page, and the number of games a player got last (by owned games row) whose recommendations are combined on
+# the game list
+RECOMMENDATIONS_PER_GAME = 10
+RECOMMENDATIONS_SHOWN = 5
+RECOMMENDATION_SOURCES = 50
+
+# Number of players shown on a game leaderboard
+LEADERBOARD_SIZE = 20
+
+# Score sketches for the percentile of a score among the players (see gamestore.percentiles): the number of buckets,
+# and the part of a game's best scores that may be added into buckets of other scores before the sketch is rebuilt
+SCORE_SKETCH_BUCKETS = 1024
+SCORE_SKETCH_ERROR = 0.01
+
+# Number of save states kept in every save slot of a player
+SAVE_STATE_HISTORY = 3
+
+# Buffered score ingest (/rest/scores/): scores are written in batches of SCORE_INGEST_BATCH_SIZE or every
+# SCORE_INGEST_FLUSH_INTERVAL seconds, a request writes them itself if SCORE_INGEST_MAX_PENDING scores are waiting and
+# new scores are refused if that does not help. A batch that failed SCORE_INGEST_MAX_ATTEMPTS times is saved one score
+# at a time and the failing scores are dropped.
+SCORE_INGEST_BATCH_SIZE = 500
+SCORE_INGEST_FLUSH_INTERVAL = 1.0
+SCORE_INGEST_MAX_PENDING = 10000
+SCORE_INGEST_MAX_ATTEMPTS = 3
+# Maximum number of scores in one request
+SCORE_INGEST_MAX_REQUEST = 100
+
+# Game message limits per user and game (see gamestore.throttle): (burst size, messages per second). A score no better
+# than the player's best score of the last SCORE_COALESCE_WINDOW seconds is not saved. A /rest/scores/ request takes a
+# token per score, so it can hold at most the burst size (10) scores of one game; the rest of its
+# SCORE_INGEST_MAX_REQUEST scores must be of other games. The ingest batches collect the scores of all players and
+# do not depend on it.
+THROTTLE_RATES = {
+    'score': (10, 1.0),
+    'save': (5, 0.2),
+}
+SCORE_COALESCE_WINDOW = 60
+
+# SQLite database shared by the workers of a host for state that needs atomic updates across processes (see
+# gamestore.localstore): the cache, the version stamps, the message limits and the locks of the cached leaderboards and
+# score sketches.
+LOCAL_STORE = os.environ.get('GAMESTORE_LOCAL_STORE', os.path.join(tempfile.gettempdir(), 'gamestore-local.sqlite3'))
+
+# Email outbox (the send_outbox command): mails are sent OUTBOX_BATCH_SIZE at a time over one connection, and a failed
+# mail is retried after OUTBOX_RETRY_DELAY seconds, doubled after every attempt up to OUTBOX_MAX_RETRY_DELAY
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_INTERVAL = 5.0
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_MAX_RETRY_DELAY = 3600
+OUTBOX_MAX_ATTEMPTS = 10
+
+# Bearer token required by /metrics/, open if not set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Rows validated and saved in one transaction by the import_games command (and read at a time by export_games)
+GAME_IMPORT_CHUNK_SIZE = 1000
+
+# Seconds a pending order is reused for new purchases of the same game, the reap_orders command marks older ones
+# expired
+ORDER_PENDING_TTL = 24 * 3600
+ORDER_REAP_BATCH_SIZE = 500
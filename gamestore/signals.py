@@ -0,0 +1,94 @@
+"""Signal receivers that keep cached data in sync with the database. Connected in GamestoreConfig.ready()."""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver, Signal
+
+from gamestore import leaderboard, percentiles
+from gamestore.entitlements import stamp_name
+from gamestore.models import Developer, Game, HighScore, Player
+from gamestore.versions import bump
+
+# Sent with a list of HighScore objects (with player and user loaded) after they have been committed
+scores_added = Signal(providing_args=['scores'])
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def game_changed(sender, **kwargs):
+    """Make every worker reload the game catalog."""
+    bump('games')
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def developer_games_changed(sender, instance, **kwargs):
+    """Reload the entitlements of the developer of an added or deleted game."""
+    if kwargs.get('created', True):
+        user_id = Developer.objects.filter(pk=instance.developer_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            bump(stamp_name(user_id))
+
+
+@receiver(m2m_changed, sender=Player.owned_games.through)
+def owned_games_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Reload the entitlements of players whose owned games change."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump(stamp_name(instance.user_id))
+    elif action == 'pre_clear':
+        # The players are not known after the clear
+        for user_id in instance.player_set.values_list('user_id', flat=True):
+            bump(stamp_name(user_id))
+    elif action in ('post_add', 'post_remove'):
+        for user_id in Player.objects.filter(pk__in=pk_set).values_list('user_id', flat=True):
+            bump(stamp_name(user_id))
+
+
+def bump_scores(game_ids):
+    """Change the stamps of the scores of the games and of the whole HighScore table (see the conditional views)."""
+    for game_id in game_ids:
+        bump('scores:{}'.format(game_id))
+    bump('scores')
+
+
+def invalidate_scores(game_id):
+    """Rebuild the leaderboard and the score sketch of a game whose scores were changed or deleted."""
+    leaderboard.invalidate(game_id)
+    percentiles.invalidate(game_id)
+
+
+@receiver(post_save, sender=HighScore)
+def score_saved(sender, instance, created, **kwargs):
+    """Announce a new score once it has been committed. Scores saved with bulk_create send scores_added themselves."""
+    if created:
+        transaction.on_commit(lambda: scores_added.send(sender=HighScore, scores=[instance]))
+    else:
+        transaction.on_commit(lambda: invalidate_scores(instance.game_id))
+        bump_scores([instance.game_id])
+
+
+@receiver(scores_added)
+def update_percentiles(sender, scores, **kwargs):
+    """Add new scores to the cached score sketches of their games."""
+    by_game = {}
+    for score in scores:
+        by_game.setdefault(score.game_id, []).append(score)
+    for game_id, game_scores in by_game.items():
+        percentiles.record_scores(game_id, game_scores)
+
+
+@receiver(scores_added)
+def update_leaderboards(sender, scores, **kwargs):
+    """Add new scores to the cached leaderboards of their games."""
+    for score in scores:
+        leaderboard.record_score(score.game_id, score.player_id, score.player.user.username, score.score,
+                                 score.time)
+    # After the leaderboards, so that a new ETag never comes with an old leaderboard
+    bump_scores({score.game_id for score in scores})
+
+
+@receiver(post_delete, sender=HighScore)
+def score_deleted(sender, instance, **kwargs):
+    """A deleted score may have been on the leaderboard, rebuild it and the score sketch."""
+    transaction.on_commit(lambda: invalidate_scores(instance.game_id))
+    bump_scores([instance.game_id])
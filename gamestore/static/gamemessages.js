@@ -1,23 +1,58 @@
+// Messages between the game in the iframe and the service. Scores, saves and loads are sent to the game's JSON
+// endpoints, so the page is not reloaded and the game keeps running.
 $(document).ready(function() {
     'use strict';
+    var endpoint = $('#game_messages').data('url');
+    var csrfToken = $('#game_messages [name=csrfmiddlewaretoken]').val();
+
+    // Send a message to the game
+    function postToGame(message) {
+        document.getElementById('game_iframe').contentWindow.postMessage(message, '*');
+    }
+
+    // Send the ERROR message of a failed request to the game
+    function postError(xhr) {
+        var message = null;
+        try {
+            message = JSON.parse(xhr.responseText);
+        } catch (e) {
+            // Not a message from the service
+        }
+        if (!message || message.messageType != 'ERROR') {
+            message = {messageType: 'ERROR', info: 'The request failed'};
+        }
+        postToGame(message);
+    }
+
+    function postJSON(url, data) {
+        return $.ajax({
+            url: url,
+            type: 'POST',
+            data: JSON.stringify(data),
+            contentType: 'application/json',
+            dataType: 'json',
+            headers: {'X-CSRFToken': csrfToken}
+        });
+    }
+
     $(window).on('message', function(event) {
         var msg = event.originalEvent.data;
         // Player submits a score
-        if(msg.messageType == 'SCORE') {
-            $('#score').val(msg.score);
-            $('#score_form').submit();
+        if (msg.messageType == 'SCORE') {
+            postJSON(endpoint + 'score/', {score: msg.score}).done(function(result) {
+                if (result.percentile !== null) {
+                    $('#score_percentile').text('Your score ' + msg.score + ' beat ' + result.percentile +
+                                                '% of the players (rank ' + result.rank + ')');
+                }
+            }).fail(postError);
         }
         // Player saves a game
         else if (msg.messageType == 'SAVE') {
-            $('#state').val(JSON.stringify(msg.gameState));
-            $('#save_form').submit();
+            postJSON(endpoint + 'save/', {gameState: msg.gameState, slot: msg.slot}).fail(postError);
         }
-        // Player loads a game
+        // Player loads a game, the response is the LOAD message for the game
         else if (msg.messageType == 'LOAD_REQUEST') {
-            if ($('#load_data').val() == 'None') {
-                $('#request_load').val('load_game');
-                $('#request_load_form').submit();
-            }
+            $.getJSON(endpoint + 'load/', msg.slot ? {slot: msg.slot} : {}).done(postToGame).fail(postError);
         }
         // Set window width and height
         else if (msg.messageType == 'SETTING') {
@@ -26,17 +61,3 @@ $(document).ready(function() {
         }
     });
 });
-
-// Send the save state to the game or an error message if the game could not be loaded
-$(document).ready(function() {
-    // Prevent page refresh before loading the data with a 0,5 second timer
-    setTimeout(function() {
-        // Get data from gameplay.html
-        var data = $('#load_data').val();
-        // Send a postMessage to the game (LOAD or ERROR) if there has been a load request
-        if (data != 'None') {
-            parsed = JSON.parse(data);
-            document.getElementById('game_iframe').contentWindow.postMessage(parsed, '*');
-        }
-    }, 500)
-});
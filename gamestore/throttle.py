@@ -0,0 +1,94 @@
+"""Rate limits and score coalescing for the game messages. Every (user, game) pair has a token bucket per kind of
+message in THROTTLE_RATES: a message takes a token and the bucket refills at a fixed rate, so a game can send short
+bursts but not a flood. A score that is not better than the best score the player sent for the game in the last
+SCORE_COALESCE_WINDOW seconds is accepted but not saved.
+
+The state is kept in the local store of the host (see gamestore.localstore), so that all gunicorn workers on the host
+share it and a throttled request costs no query of the main database.
+"""
+import logging
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+
+from gamestore import localstore
+
+logger = logging.getLogger(__name__)
+
+# Part of the calls that also delete the expired rows
+CLEANUP_CHANCE = 0.001
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS best_score (key TEXT PRIMARY KEY, score INTEGER NOT NULL, updated REAL NOT NULL)',
+)
+
+
+def _update(read, write, key, compute, default):
+    """Read the row of a key, compute the new row and the result from it and write it in one transaction, so that
+    concurrent workers never update the same key from the same old value. Returns 'default' if the store fails, the
+    messages are not limited then.
+    """
+    now = time.time()
+    try:
+        with localstore.immediate(SCHEMA) as connection:
+            row = connection.execute(read, (key,)).fetchone()
+            values, result = compute(row, now)
+            if values is not None:
+                connection.execute(write, (key,) + values)
+        if random.random() < CLEANUP_CHANCE:
+            cleanup(now)
+    except sqlite3.Error:
+        logger.exception('Throttle store %s failed', settings.LOCAL_STORE)
+        return default
+    return result
+
+
+def capacity(kind):
+    """The most tokens a bucket of the kind holds, None if the kind is not limited."""
+    return settings.THROTTLE_RATES[kind][0] if kind in settings.THROTTLE_RATES else None
+
+
+def take(kind, user_id, game_id, count=1):
+    """Take 'count' tokens (at most the capacity) from the bucket of a user and a game. Returns 0 if the messages are
+    allowed, otherwise the seconds until the bucket has the tokens again. Kinds missing from THROTTLE_RATES are not
+    limited.
+    """
+    if kind not in settings.THROTTLE_RATES:
+        return 0
+    capacity, rate = settings.THROTTLE_RATES[kind]
+
+    def compute(row, now):
+        tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+        if tokens < count:
+            return None, (count - tokens) / rate
+        return (tokens - count, now), 0
+
+    return _update('SELECT tokens, updated FROM bucket WHERE key = ?',
+                   'INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                   '{}:{}:{}'.format(kind, user_id, int(game_id)), compute, 0)
+
+
+def is_new_best(user_id, game_id, score):
+    """True if the score should be saved: it is better than the best score of the user in the game in the last
+    SCORE_COALESCE_WINDOW seconds or there is no such score. A saved score starts a new window.
+    """
+    def compute(row, now):
+        if row is not None and now - row[1] < settings.SCORE_COALESCE_WINDOW and score <= row[0]:
+            return None, False
+        return (score, now), True
+
+    return _update('SELECT score, updated FROM best_score WHERE key = ?',
+                   'INSERT OR REPLACE INTO best_score (key, score, updated) VALUES (?, ?, ?)',
+                   '{}:{}'.format(user_id, int(game_id)), compute, True)
+
+
+def cleanup(now=None):
+    """Delete the buckets that have refilled and the best scores whose window has passed."""
+    now = now or time.time()
+    refill = max([capacity / rate for capacity, rate in settings.THROTTLE_RATES.values()] or [0])
+    connection = localstore.connect(SCHEMA)
+    connection.execute('DELETE FROM bucket WHERE updated < ?', (now - refill,))
+    connection.execute('DELETE FROM best_score WHERE updated < ?', (now - settings.SCORE_COALESCE_WINDOW,))
@@ -24,10 +24,15 @@ urlpatterns = [
     url(r'^login/$', views.login_view),
     url(r'^logout/$', views.logout_view),
     url(r'^account/$', views.account),
+    url(r'^account/sales/$', views.sales_overview),
     url(r'^account/sales/([0-9]+)/$', views.sales),
     url(r'^game/([0-9]+)/$', views.gameplay, name='gameplay'),
+    url(r'^game/([0-9]+)/score/$', views.game_score, name='game_score'),
+    url(r'^game/([0-9]+)/save/$', views.game_save, name='game_save'),
+    url(r'^game/([0-9]+)/load/$', views.game_load, name='game_load'),
     url(r'^$', views.gamelist, name='index'),
     url(r'^gamelist/$', views.gamelist, name='gamelist'),
+    url(r'^search/autocomplete/$', views.search_autocomplete, name='search_autocomplete'),
     url(r'^addgame/$', views.add_game, name='addgame'),
     url(r'^buygame/([0-9]+)/$', views.buy_game, name='buygame'),
     url(r'^payment/success/$', views.payment_successful, name='payment_successful'),
@@ -39,6 +44,9 @@ urlpatterns = [
     url(r'^account/edit/game/([0-9]+)$', views.edit_game),
     url(r'^rest/$', views.rest_info),
     url(r'^rest/highscores/$', views.rest_high_scores),
+    url(r'^rest/scores/$', views.rest_scores),
     url(r'^rest/sales/$', views.rest_sales),
+    url(r'^rest/sales/rollups/$', views.rest_sales_rollups),
     url(r'^rest/games/$', views.rest_games),
+    url(r'^metrics/$', views.metrics),
 ]
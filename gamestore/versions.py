@@ -0,0 +1,76 @@
+"""Version stamps for cached data. A stamp is a row in the local store of the host (see gamestore.localstore) so that
+every worker process notices when another process changes the data behind it. Stamps are never evicted, and a missing
+stamp is created atomically, so all processes agree on it. Reading a stamp costs a primary key lookup in the local
+store, no queries of the main database.
+"""
+import datetime
+import logging
+import sqlite3
+import time
+import uuid
+from collections import namedtuple
+from hashlib import md5
+
+from django.db import transaction
+from django.utils import timezone
+
+from gamestore import localstore
+
+logger = logging.getLogger(__name__)
+
+Stamp = namedtuple('Stamp', ('token', 'time'))
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS version_stamp (name TEXT PRIMARY KEY, token TEXT NOT NULL, time REAL NOT NULL)',
+)
+
+
+def _new_stamp():
+    return Stamp(uuid.uuid4().hex, time.time())
+
+
+def get_stamp(name):
+    """Return the current stamp of 'name'. A missing stamp (cold start) is created, which makes all processes rebuild
+    whatever they have cached for it. If the store fails every call returns a new stamp, so nothing is reused.
+    """
+    read = 'SELECT token, time FROM version_stamp WHERE name = ?'
+    try:
+        connection = localstore.connect(SCHEMA)
+        row = connection.execute(read, (name,)).fetchone()
+        if row is None:
+            # Another process may create the stamp at the same time, the first one wins
+            connection.execute('INSERT OR IGNORE INTO version_stamp (name, token, time) VALUES (?, ?, ?)',
+                               (name,) + _new_stamp())
+            row = connection.execute(read, (name,)).fetchone()
+        return Stamp(*row)
+    except sqlite3.Error:
+        logger.exception('Reading the stamp %s failed', name)
+        return _new_stamp()
+
+
+def _set_stamp(name):
+    try:
+        localstore.connect(SCHEMA).execute('INSERT OR REPLACE INTO version_stamp (name, token, time) VALUES (?, ?, ?)',
+                                           (name,) + _new_stamp())
+    except sqlite3.Error:
+        logger.exception('Bumping the stamp %s failed', name)
+
+
+def bump(name):
+    """Give 'name' a new stamp once the current transaction commits, so that no process can rebuild its cache from
+    data that is not yet visible.
+    """
+    transaction.on_commit(lambda: _set_stamp(name))
+
+
+def etag(stamps, *parts):
+    """An ETag for a response that only changes when the stamps change. 'parts' are anything else the response
+    depends on.
+    """
+    key = '-'.join([stamp.token for stamp in stamps] + [str(part) for part in parts])
+    return md5(key.encode('utf-8')).hexdigest()
+
+
+def last_modified(stamps):
+    """The time of the latest change of the stamps."""
+    return datetime.datetime.fromtimestamp(max(stamp.time for stamp in stamps), timezone.utc)
@@ -1,101 +1,293 @@
+import bisect
 import json
+from functools import wraps
 from hashlib import md5
 
 from django.conf import settings
-from django.contrib.auth import authenticate, logout, update_session_auth_hash
+from django.contrib.auth import authenticate, logout, update_session_auth_hash, SESSION_KEY
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Permission
 from django.contrib.contenttypes.models import ContentType
-from django.core import serializers
 from django.core.exceptions import PermissionDenied
-from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Sum
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_POST, condition
 from django.views.defaults import permission_denied, bad_request
 
+from gamestore import ingest, percentiles, rollups, savestates, throttle
+from gamestore.catalog import get_catalog
+from gamestore.entitlements import get_entitlements, stamp_name
 from gamestore.exceptions import BadRequest
 from gamestore.forms import LoginForm, GameForm, RegisterForm, ScoreForm, SaveForm, EditNameForm, EditPasswordForm, \
-    RequestLoadForm, EditGameForm, SearchForm
-from .models import Player, Developer, Game, HighScore, Order, SaveState
+    EditGameForm, SearchForm
+from gamestore.leaderboard import get_leaderboard, window_start, window_stamps, WINDOWS
+from gamestore.metrics import exposition
+from gamestore.orders import pending_order, finalize_order
+from gamestore.profiles import get_profile
+from gamestore.recommendations import recommended_games, recommended_for
+from gamestore.outbox import queue_mail
+from gamestore.replicas import read_only
+from gamestore.rest import page_limit, decode_cursor, encode_cursor, json_page_response, keyset_after, iter_keyset, \
+    ndjson_response, csv_response, parse_time
+from gamestore.search import get_index
+from gamestore.versions import get_stamp, etag, last_modified
+from .models import Player, Developer, Game, HighScore, Order, SalesRollup
+
+
+def conditional(stamp_names, per_login=False):
+    """Conditional GET for a view whose response only changes with version stamps. 'stamp_names' returns the names of
+    the stamps for the arguments of the view. The ETag and Last-Modified validators are computed from the stamps
+    without queries, so an unchanged page is answered with 304 before the view runs. Pages that change with the login
+    (per_login) get only an ETag, because a login or logout does not change any modification time.
+    """
+    def stamps(request, *args, **kwargs):
+        if not hasattr(request, '_stamps'):
+            request._stamps = [get_stamp(name) for name in stamp_names(request, *args, **kwargs)]
+        return request._stamps
+
+    def etag_func(request, *args, **kwargs):
+        if per_login:
+            return etag(stamps(request, *args, **kwargs), SESSION_KEY in request.session)
+        return etag(stamps(request, *args, **kwargs))
+
+    def last_modified_func(request, *args, **kwargs):
+        return None if per_login else last_modified(stamps(request, *args, **kwargs))
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Caches may keep the response but must check the validators before using it
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        return wraps(view)(wrapper)
+
+    return decorator
+
+
+def high_score_stamps(request):
+    """The stamps of /rest/highscores/: the scores of one game or of all games and the current day or week."""
+    names = ['games'] + window_stamps(request.GET.get('window', 'all'))
+    if 'game' in request.GET:
+        game = get_catalog().by_name.get(request.GET['game'])
+        return names + (['scores:{}'.format(game.pk)] if game is not None else [])
+    return names + ['scores']
+
+
+def gamelist_stamps(request):
+    """The stamps of the game list: the games, the recommendations and the owned games of a logged in user."""
+    names = ['games', 'recommendations']
+    if SESSION_KEY in request.session:
+        names.append(stamp_name(request.session[SESSION_KEY]))
+    return names
 
 
 def gameplay(request, gameid):
-    """Gameplay view for individual games. Handles messages from game to service and service to game."""
+    """Gameplay view for individual games. Messages from the game are sent to the JSON endpoints below by
+    gamemessages.js.
+    """
     # The game in the iframe
-    game = Game.objects.get(pk=gameid)
+    game = get_catalog().get(gameid)
 
-    # Check if the player has bought the game and can play it
-    if hasattr(request.user, 'player'):
-        player_owns_game = request.user.player.owned_games.filter(pk=gameid).exists()
-    else:
-        player_owns_game = False
-
-    # Check if the developer owns the game and can browse sales statistics for this game
-    if hasattr(request.user, 'developer'):
-        developer_owns_game = request.user.developer.added_games.filter(pk=gameid).exists()
-    else:
-        developer_owns_game = False
-
-    # Handle messages coming from the game
-    load_data = None
-    if hasattr(request.user, 'player') and request.method == 'POST':
-        # Player submits a score
-        if request.POST.get('score'):
-            score_form = ScoreForm(data=request.POST)
-            if score_form.is_valid():
-                d = score_form.cleaned_data
-                HighScore(player=request.user.player, game=game, score=d['score']).save()
-        # Player saves a game
-        elif request.POST.get('state'):
-            save_form = SaveForm(data=request.POST)
-            if save_form.is_valid():
-                # return redirect(save_form.cleaned_data)
-                save_state = save_form.cleaned_data['state']
-                SaveState(player=request.user.player, game=game, state=save_state).save()
-        # Player loads a game
-        elif request.POST.get('request_load'):
-            request_load_form = RequestLoadForm(data=request.POST)
-            save_states = SaveState.objects.filter(player=request.user.player, game=game)
-            if request_load_form.is_valid() and save_states.exists():
-                game_state = save_states.latest('pk').state  # Load the latest save
-                load_data = '{"messageType": "LOAD", "gameState":' + game_state + '}'
-            else:
-                # Send back an error message if the game cannot be loaded
-                load_data = '{"messageType": "ERROR", "info": "Gamestate could not be loaded"}'
+    # Check if the player has bought the game and can play it, or if the developer owns the game and can browse
+    # sales statistics for this game
+    entitlements = get_entitlements(request)
+    player_owns_game = entitlements.is_player and entitlements.owns(game.pk)
+    developer_owns_game = entitlements.is_developer and entitlements.owns(game.pk)
 
     return render(request, 'gameplay.html',
-                  {'game': game, 'player_owns_game': player_owns_game, 'developer_owns_game': developer_owns_game,
-                   'load_data': load_data})
+                  {'game': game, 'is_player': entitlements.is_player, 'player_owns_game': player_owns_game,
+                   'developer_owns_game': developer_owns_game, 'recommendations': recommended_games(game.pk)})
 
 
-def gamelist(request):
-    """Browse games view. (Homeview)"""
+def message_error(info, status):
+    """An ERROR message of the game messaging protocol."""
+    return JsonResponse({'messageType': 'ERROR', 'info': info}, status=status)
+
+
+def playable_game(request, gameid):
+    """Return the game and None if the user is a player who can play it (owns it or it is free), otherwise None and
+    the ERROR message to send.
+    """
+    entitlements = get_entitlements(request)
+    if not entitlements.is_player:
+        return None, message_error('The game cannot be played', 403)
+    try:
+        game = get_catalog().get(gameid)
+    except Game.DoesNotExist:
+        return None, message_error('The game does not exist', 404)
+    if game.price != 0 and not entitlements.owns(game.pk):
+        return None, message_error('The game cannot be played', 403)
+    return game, None
+
+
+def throttled(kind):
+    """Limit the messages of one kind from a user and a game to THROTTLE_RATES[kind]. The user is read from the
+    session, so a throttled request is answered with 429 before any other query.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, gameid, *args, **kwargs):
+            user_id = request.session.get(SESSION_KEY)
+            if user_id is not None:
+                wait = throttle.take(kind, user_id, gameid)
+                if wait:
+                    response = message_error('Too many messages, try again later', 429)
+                    response['Retry-After'] = str(int(wait) + 1)
+                    return response
+            return view(request, gameid, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@require_POST
+@throttled('score')
+def game_score(request, gameid):
+    """Handle a SCORE message of a game, {"score": n}. The score is queued and written in the background. A score that
+    is not better than the player's best score of the last SCORE_COALESCE_WINDOW seconds is accepted but not saved.
+    The response has the rank of the score among the game's scores and the percentage of the scores it beats.
+    """
+    game, error = playable_game(request, gameid)
+    if error is not None:
+        return error
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except (ValueError, TypeError):
+        return message_error('Invalid score', 400)
+    if not isinstance(data, dict):
+        return message_error('Invalid score', 400)
+    score_form = ScoreForm(data=data)
+    if not score_form.is_valid():
+        return message_error('Invalid score', 400)
+
+    score = score_form.cleaned_data['score']
+    if throttle.is_new_best(request.user.pk, game.pk, score):
+        if not ingest.submit([HighScore(player=request.profile.player, game=game, score=score)]):
+            return message_error('Scores cannot be saved right now', 503)
+    rank, percentile = percentiles.get_sketch(game.pk).rank(score)
+    return JsonResponse({'accepted': 1, 'rank': rank, 'percentile': percentile}, status=202)
+
+
+@require_POST
+@throttled('save')
+def game_save(request, gameid):
+    """Handle a SAVE message of a game, {"gameState": {...}, "slot": optional slot name}."""
+    game, error = playable_game(request, gameid)
+    if error is not None:
+        return error
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        state = data['gameState']
+        save_form = SaveForm(data={'state': json.dumps(state), 'slot': data.get('slot')})
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return message_error('Invalid game state', 400)
+    # A null state would be saved and loaded back as a game state
+    if state is None or not save_form.is_valid():
+        return message_error('Invalid game state', 400)
+
+    d = save_form.cleaned_data
+    savestates.save_state(request.profile.player, game, d['state'], d['slot'])
+    return JsonResponse({'saved': True})
+
+
+def game_load(request, gameid):
+    """Handle a LOAD_REQUEST message of a game. Returns the LOAD message with the latest save of the slot ('slot' GET
+    parameter) or an ERROR message.
+    """
+    game, error = playable_game(request, gameid)
+    if error is not None:
+        return error
+
+    game_state = savestates.load_state(request.profile.player, game, request.GET.get('slot'))
+    if game_state is None:
+        # Send back an error message if the game cannot be loaded
+        return message_error('Gamestate could not be loaded', 404)
+    # The state is stored as JSON, so it is sent as it is
+    return HttpResponse('{"messageType": "LOAD", "gameState": ' + game_state + '}', content_type='application/json')
 
-    # Set all games to be rended in case search requests fail
-    games = Game.objects.all()
+
+def game_page_limit(request):
+    return page_limit(request, settings.GAME_PAGE_SIZE, settings.GAME_MAX_PAGE_SIZE)
+
+
+def page_url(request, cursor=None):
+    """The URL of the current list with another 'cursor' GET parameter, the first page without one."""
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    if cursor is not None:
+        query['cursor'] = cursor
+    return '?' + query.urlencode()
+
+
+@read_only
+@conditional(gamelist_stamps, per_login=True)
+def gamelist(request):
+    """Browse games view. (Homeview) The games are searched by name and description from the in-memory search index,
+    ranked by relevance and optionally limited to one category. The results are shown 'limit' at a time, the 'cursor'
+    GET parameter holds the sort key of the last game of the previous page.
+    """
+    query = ''
+    category = None
 
     # Take search requests to filter the games
     if request.method == 'GET':
         search_form = SearchForm(request.GET)
         if search_form.is_valid():
             d = search_form.cleaned_data
+            query = d['name']
             # Filter by game category
-            if d['category']:
-                if d['category'] in settings.GAME_CATEGORIES:
-                    games = games.filter(category=d['category'])
-            # Filter game by name
-            elif d['name']:
-                games = games.filter(name__icontains=d['name'])
+            if d['category'] in settings.GAME_CATEGORIES:
+                category = d['category']
+
+    games, keys, facets = get_index().search(query, category)
+
+    try:
+        limit = game_page_limit(request)
+        start = 0
+        if 'cursor' in request.GET and keys:
+            start = bisect.bisect_right(keys, tuple(decode_cursor(request.GET['cursor'], len(keys[0]))))
+    except (BadRequest, TypeError):
+        return bad_request(request, BadRequest)
+    end = start + limit
+
+    # Recommendations from the owned games of a player on the first page
+    recommendations = []
+    if start == 0:
+        entitlements = get_entitlements(request)
+        if entitlements.is_player:
+            recommendations = recommended_for(entitlements.profile_id, entitlements.games)
 
     return render(request, 'gamelist.html', {
         'categories': settings.GAME_CATEGORIES,
-        'games': games})
+        'games': games[start:end],
+        'facets': facets,
+        'recommendations': recommendations,
+        'query': query,
+        'category': category,
+        'first_page': page_url(request) if start > 0 else None,
+        'next_page': page_url(request, encode_cursor(*keys[end - 1])) if end < len(games) else None})
+
+
+@read_only
+def search_autocomplete(request):
+    """Return game names that complete the search text 'q' as a JSON list."""
+    return JsonResponse(get_index().autocomplete(request.GET.get('q', '')), safe=False)
 
 
 @login_required(login_url='/login/')
 def add_game(request):
     """View to a form where developers can add more games to the gamestore."""
-    if not request.user.has_perm('gamestore.developer'):
+    if not request.profile.is_developer:
         return permission_denied(request, PermissionDenied)
 
     # Validate the form and add a new game to the database
@@ -152,35 +344,38 @@ def register_view(request):
                     'account_type': d['account_type']
                 })
 
-            # Create a new user
-            user = User.objects.create_user(username=d['username'], password=d['password'])
-            user.first_name = d['first_name']
-            user.last_name = d['last_name']
-            user.email = d['email']
-            account_type = d['account_type']
-
-            # Create user profile (player or developer) and set user permissions
-            model = Player if account_type == 'player' else Developer
-            content_type = ContentType.objects.get_for_model(model)
-            permission = Permission.objects.get(codename=account_type, content_type=content_type)
-            user.user_permissions.add(permission)
-            user.save()
-
-            # Set an unique user_hash to the user for email verification
-            profile = Player.create(user) if account_type == 'player' else Developer.create(user)
-            m = md5(user.username.encode('ascii'))
-            userhash = m.hexdigest()
-            profile.user_hash = userhash
-            profile.save()
-
-            # Compose and send a verification email to the user
-            from_email = settings.EMAIL_HOST_USER
-            to_email = [from_email, d['email']]
-            email_msg = 'Welcome to the GameStore service, ' + d['username'] + \
-                        '! \nHere is your email validation link to activate your account. Visit the link to be able' \
-                        ' to log in to your account and play the awesome games and compete with other players! \n\n'
-            email_msg += request.build_absolute_uri('activate/' + userhash)
-            send_mail('Verification code', email_msg, from_email, to_email, fail_silently=False)
+            # The user, the profile and the verification email are saved together
+            with transaction.atomic():
+                # Create a new user
+                user = User.objects.create_user(username=d['username'], password=d['password'])
+                user.first_name = d['first_name']
+                user.last_name = d['last_name']
+                user.email = d['email']
+                account_type = d['account_type']
+
+                # Create user profile (player or developer) and set user permissions
+                model = Player if account_type == 'player' else Developer
+                content_type = ContentType.objects.get_for_model(model)
+                permission = Permission.objects.get(codename=account_type, content_type=content_type)
+                user.user_permissions.add(permission)
+                user.save()
+
+                # Set an unique user_hash to the user for email verification
+                profile = Player.create(user) if account_type == 'player' else Developer.create(user)
+                m = md5(user.username.encode('ascii'))
+                userhash = m.hexdigest()
+                profile.user_hash = userhash
+                profile.save()
+
+                # Compose a verification email to the user, the outbox worker sends it
+                from_email = settings.EMAIL_HOST_USER
+                to_email = [from_email, d['email']]
+                email_msg = 'Welcome to the GameStore service, ' + d['username'] + \
+                            '! \nHere is your email validation link to activate your account. Visit the link to be' \
+                            ' able to log in to your account and play the awesome games and compete with other' \
+                            ' players! \n\n'
+                email_msg += request.build_absolute_uri('activate/' + userhash)
+                queue_mail('Verification code', email_msg, from_email, to_email)
 
             return redirect('/login/?activation_sent=' + d['email'])
 
@@ -226,15 +421,12 @@ def login_view(request):
             user = authenticate(username=d['username'], password=d['password'])
             if user is not None:
                 # Check if the account has been activated through email
-                if hasattr(user, 'player'):
-                    if not user.player.activated:
-                        return redirect('/login/?activated=fail')
-                elif hasattr(user, 'developer'):
-                    if not user.developer.activated:
-                        return redirect('/login/?activated=fail')
-                else:
+                profile = get_profile(user)
+                if profile.role is None:
                     # The user is not player or developer. Should not happen.
                     return bad_request(request, BadRequest)
+                if not profile.activated:
+                    return redirect('/login/?activated=fail')
 
                 login(request, user)
 
@@ -254,16 +446,34 @@ def logout_view(request):
 
 @login_required(login_url='/login/')
 def account(request):
-    """A view for users account page where you can edit your name and password and view owned games etc."""
+    """A view for users account page where you can edit your name and password and view owned games etc. The owned
+    games of players and the added games of developers are shown 'limit' at a time in primary key order, the 'cursor'
+    GET parameter holds the primary key of the last game of the previous page.
+    """
     # Get owned games for players and added games for developers.
-    if hasattr(request.user, 'player'):
+    if request.profile.is_player:
         account_type = 'Player'
-        games = request.user.player.owned_games.all()
+        games = request.profile.player.owned_games.all()
     else:
         account_type = 'Developer'
-        games = request.user.developer.added_games.all()
+        games = request.profile.developer.added_games.all()
+
+    try:
+        limit = game_page_limit(request)
+        if 'cursor' in request.GET:
+            games = games.filter(pk__gt=int(decode_cursor(request.GET['cursor'], 1)[0]))
+    except (BadRequest, TypeError, ValueError):
+        return bad_request(request, BadRequest)
+    # Only the columns of the game cards (the developer's added_games sets the developer of every game), one extra
+    # game tells if there is a next page
+    games = list(games.order_by('pk').only('name', 'category', 'description', 'developer')[:limit + 1])
+    next_page = page_url(request, encode_cursor(games[limit - 1].pk)) if len(games) > limit else None
 
-    return render(request, 'account.html', {'account_type': account_type, 'games': games})
+    return render(request, 'account.html', {
+        'account_type': account_type,
+        'games': games[:limit],
+        'first_page': page_url(request) if 'cursor' in request.GET else None,
+        'next_page': next_page})
 
 
 @login_required(login_url='/login/')
@@ -303,15 +513,13 @@ def edit_password(request):
 @login_required(login_url='/login/')
 def edit_game(request, gameid):
     """Edit game information. Only developers can edit their own games."""
-    # Check if the user is a developer
-    if not request.user.has_perm('gamestore.developer'):
+    # Check if the user is a developer and owns the game
+    entitlements = get_entitlements(request)
+    if not entitlements.is_developer or not entitlements.owns(gameid):
         return permission_denied(request, PermissionDenied)
 
     # The game to be edited
     game = Game.objects.get(pk=gameid)
-    # Check if the developer owns the game
-    if not request.user.developer.added_games.filter(pk=gameid).exists():
-        return permission_denied(request, PermissionDenied)
 
     # Validate the edit form and save the changes
     if request.method == 'POST':
@@ -330,33 +538,70 @@ def edit_game(request, gameid):
 
 @login_required(login_url='/login/')
 def sales(request, gameid):
-    """A view to check sales statistics. Only developers can check sales statistics for their own games."""
-    game = Game.objects.get(pk=gameid)
-    orders = Order.objects.filter(game=game, status=True)
-    return render(request, 'sales.html', {'game': game, 'orders': orders})
+    """A view to check sales statistics. Only developers can check sales statistics for their own games. The totals
+    are read from the daily sales rollups and summed per day, week or month ('period' GET parameter).
+    """
+    game = get_catalog().get(gameid)
+    if game.developer.user_id != request.user.pk:
+        return permission_denied(request, PermissionDenied)
+
+    period = request.GET.get('period', 'day')
+    if period not in rollups.PERIODS:
+        return bad_request(request, BadRequest)
+
+    totals = rollups.report(SalesRollup.objects.filter(game=game), period)
+    return render(request, 'sales.html', {
+        'game': game,
+        'totals': totals,
+        'period': period,
+        'periods': rollups.PERIODS,
+        'units': sum(total['units'] for total in totals),
+        'revenue': sum(total['revenue'] for total in totals)
+    })
 
 
 @login_required(login_url='/login/')
-def buy_game(request, gameid):
-    """A view where players can buy a new game. Creates a new Order-object and prepares parameters for the mockup
-    payment service.
-    """
-    # Check if the user is a player
-    if not request.user.has_perm('gamestore.player'):
+def sales_overview(request):
+    """A view to check the sales statistics of all games of a developer, summed per period and per game."""
+    if not request.profile.is_developer:
         return permission_denied(request, PermissionDenied)
 
-    # Check if the player already owns the game
-    if request.user.player.owned_games.filter(pk=gameid).exists():
+    period = request.GET.get('period', 'day')
+    if period not in rollups.PERIODS:
+        return bad_request(request, BadRequest)
+
+    developer_rollups = SalesRollup.objects.filter(seller__user=request.user)
+    totals = rollups.report(developer_rollups, period)
+    catalog = get_catalog()
+    games = [(catalog.get(row['game_id']), row['units'], row['revenue']) for row in
+             developer_rollups.values('game_id').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by()]
+
+    return render(request, 'sales.html', {
+        'totals': totals,
+        'games': sorted(games, key=lambda game: -game[2]),
+        'period': period,
+        'periods': rollups.PERIODS,
+        'units': sum(total['units'] for total in totals),
+        'revenue': sum(total['revenue'] for total in totals)
+    })
+
+
+@login_required(login_url='/login/')
+def buy_game(request, gameid):
+    """A view where players can buy a new game. Reuses the player's pending order of the game or creates a new one and
+    prepares parameters for the mockup payment service.
+    """
+    # Check if the user is a player and does not own the game yet
+    entitlements = get_entitlements(request)
+    if not entitlements.is_player or entitlements.owns(gameid):
         return permission_denied(request, PermissionDenied)
 
     # Free games cannot be bought
-    game = Game.objects.get(pk=gameid)
+    game = get_catalog().get(gameid)
     if game.price == 0:
         return permission_denied(request, PermissionDenied)
 
-    # Create a new order object
-    order = Order(buyer=request.user.player, seller=game.developer, game=game, price=game.price)
-    order.save()
+    order = pending_order(request.profile.player, game)
     pid = order.pk
 
     # Calculate checksum for the payment service
@@ -380,7 +625,7 @@ def payment_successful(request):
     the mockup payment service.
     """
     # Check if the user is a player
-    if not request.user.has_perm('gamestore.player'):
+    if not request.profile.is_player:
         return permission_denied(request, PermissionDenied)
 
     result = request.GET.get('result')  # success/cancel/error, should be success
@@ -402,12 +647,12 @@ def payment_successful(request):
     if checksum1 != checksum2:
         return bad_request(request, BadRequest)
 
-    # The purchase process was valid, finalize the order by changing the status of the order to True
-    order = Order.objects.get(pk=pid)
-    order.status = True
-    order.save()
-    game = Game.objects.get(pk=order.game.pk)
-    request.user.player.owned_games.add(game)
+    # The purchase process was valid, mark the order paid and give the game to the player. Does nothing if the
+    # order has already been paid.
+    order = finalize_order(pid, request.profile.player)
+    if order is None:
+        return bad_request(request, BadRequest)
+    game = get_catalog().get(order.game_id)
 
     return render(request, 'post_payment.html', {'state': result, 'order': order, 'game': game})
 
@@ -416,7 +661,7 @@ def payment_successful(request):
 def payment_cancel(request):
     """A view for handling cancelled payments when purchasing a game."""
     # Check if the user is a player
-    if not request.user.has_perm('gamestore.player'):
+    if not request.profile.is_player:
         return permission_denied(request, PermissionDenied)
 
     # Check if the result message is correct
@@ -431,7 +676,7 @@ def payment_cancel(request):
 def payment_error(request):
     """A view for handling errors in payments when purchasing a game."""
     # Check if the user is a player
-    if not request.user.has_perm('gamestore.player'):
+    if not request.profile.is_player:
         return permission_denied(request, PermissionDenied)
 
     # Check if the result message is correct
@@ -442,124 +687,291 @@ def payment_error(request):
     return render(request, 'post_payment.html', {'state': result})
 
 
+@read_only
+@conditional(lambda request, gameid: ['games', 'scores:{}'.format(int(gameid))] +
+             window_stamps(request.GET.get('window', 'all')), per_login=True)
 def high_scores(request, gameid):
-    """A view for displaying high scores for a game."""
-    game = Game.objects.get(pk=gameid)
-    scores = HighScore.objects.filter(game=game)
-    return render(request, 'highscores.html', {'scores': scores, 'game': game})
+    """A view for displaying high scores for a game. Shows the best score of the top players from the leaderboard of
+    all time, this week or today ('window' GET parameter).
+    """
+    game = get_catalog().get(gameid)
+    window = request.GET.get('window', 'all')
+    if window not in WINDOWS:
+        return bad_request(request, BadRequest)
+
+    scores = get_leaderboard(game.pk, window)
+    return render(request, 'highscores.html', {'scores': scores, 'game': game, 'size': settings.LEADERBOARD_SIZE,
+                                               'window': window, 'windows': WINDOWS})
 
 
+@read_only
 def rest_info(request):
     """A view for rendering RESTful API welcome page."""
     return render(request, 'rest_info.html')
 
 
+@read_only
+@conditional(high_score_stamps)
 def rest_high_scores(request):
-    """A view for RESTful API for fetching high score data."""
-    highscores = HighScore.objects.all()
-    if request.method == 'GET':
-        # Filter by name of the game
-        if 'game' in request.GET:
-            if Game.objects.filter(name=request.GET['game']).exists():
-                game = Game.objects.get(name=request.GET['game'])
-                highscores = highscores.filter(game=game)
-            else:
-                highscores = []
+    """A view for RESTful API for fetching high score data. Scores are read with a single joined query ordered by
+    score and streamed out as JSON one page at a time. The 'next' cursor of a page fetches the following page.
+    With the 'leaderboard' parameter the best score of the top players of a game is returned from the leaderboard and
+    with the 'score' parameter the rank and percentile of that score among the best scores of the players of the game.
+    The 'window' parameter limits the scores and the leaderboard to this week or today.
+    """
+    window = request.GET.get('window', 'all')
+    if window not in WINDOWS:
+        return bad_request(request, BadRequest)
+
+    if 'score' in request.GET:
+        game = get_catalog().by_name.get(request.GET.get('game'))
+        try:
+            score = int(request.GET['score'])
+        except ValueError:
+            return bad_request(request, BadRequest)
+        if game is None:
+            return bad_request(request, BadRequest)
+        sketch = percentiles.get_sketch(game.pk)
+        rank, percentile = sketch.rank(score)
+        return JsonResponse({'game': game.name, 'score': score, 'rank': rank, 'percentile': percentile,
+                             'players': sketch.total})
+
+    if 'leaderboard' in request.GET:
+        game = get_catalog().by_name.get(request.GET.get('game'))
+        entries = get_leaderboard(game.pk, window) if game is not None else []
+        return JsonResponse({'results': [
+            {'rank': rank, 'player': entry.username, 'score': entry.score} for rank, entry in enumerate(entries, 1)
+        ]})
+
+    try:
+        limit = page_limit(request)
+        cursor = None
+        if 'cursor' in request.GET:
+            cursor = [int(value) for value in decode_cursor(request.GET['cursor'], 2)]
+    except (BadRequest, TypeError, ValueError):
+        return bad_request(request, BadRequest)
 
-    # Convert player ids to usernames and game ids to game names
-    data = serializers.serialize('json', highscores)
-    data_json = json.loads(data)
-    for d in data_json:
-        d['fields']['player'] = Player.objects.get(pk=d['fields']['player']).user.username
-        d['fields']['game'] = Game.objects.get(pk=d['fields']['game']).name
-        # Remove model information from the returned data
-        d.pop('model')
-    data = json.dumps(data_json)
+    # Read backwards from the (score, id) index, or the (game, score) index that ends with the id on SQLite
+    ordering = ('-score', '-pk')
+    highscores = HighScore.objects.order_by(*ordering)
+    # Filter by name of the game
+    if 'game' in request.GET:
+        highscores = highscores.filter(game__name=request.GET['game'])
+    if window != 'all':
+        highscores = highscores.filter(time__gte=window_start(window))
+    # Continue after the last score of the previous page
+    if cursor is not None:
+        highscores = highscores.filter(keyset_after(ordering, cursor))
 
-    return render(request, 'rest_highscores.html', {'data': data})
+    # Player usernames and game names are joined in the same query
+    rows = highscores.values_list('pk', 'player__user__username', 'game__name', 'score', 'time')[:limit + 1].iterator()
 
+    def serialize(row):
+        return {'pk': row[0], 'fields': {'player': row[1], 'game': row[2], 'score': row[3], 'time': row[4]}}
 
+    return json_page_response(rows, limit, serialize, lambda row: encode_cursor(row[3], row[0]))
+
+
+SALES_EXPORT_FIELDS = ('pk', 'purchase_time', 'buyer', 'seller', 'game', 'price', 'status')
+
+
+@read_only
 def rest_sales(request):
     """A view for RESTful API for fetching sales statistic data. Only developers can fetch sales statistic data for
     their own games.
+
+    Orders are read with one joined query in (purchase_time, pk) order. The default JSON format is paged with the
+    'limit' and 'cursor' parameters, 'format=ndjson' and 'format=csv' stream the whole selection as an export. The
+    'since' and 'until' parameters select a purchase time range for incremental pulls.
     """
     # Check if the user is a developer
-    if not request.user.has_perm('gamestore.developer'):
+    if not request.profile.is_developer:
         return permission_denied(request, PermissionDenied)
 
     # Allow only requests for the developers own sales statistics
-    orders = request.user.developer.sales.all()
+    orders = Order.objects.filter(seller__user=request.user)
+    ordering = ('purchase_time', 'pk')
+    export_format = request.GET.get('format', 'json')
 
-    if request.method == 'GET':
+    try:
+        if export_format not in ('json', 'ndjson', 'csv'):
+            raise BadRequest('Unknown format')
         # Filter by order id
         if 'order' in request.GET:
-            orders = orders.filter(pk=request.GET['order'])
+            orders = orders.filter(pk=int(request.GET['order']))
         # Filter by game name
         if 'game' in request.GET:
-            if Game.objects.filter(name=request.GET['game']).exists():
-                game = Game.objects.get(name=request.GET['game'])
-                orders = orders.filter(game=game)
-            else:
-                orders = []
+            orders = orders.filter(game__name=request.GET['game'])
         # Filter by buyer (username in this case!)
         if 'buyer' in request.GET:
-            if User.objects.filter(username=request.GET['buyer']).exists():
-                user = User.objects.get(username=request.GET['buyer'])
-                if hasattr(user, 'player'):
-                    orders = orders.filter(buyer=user.player)
-                else:
-                    orders = []
-            else:
-                orders = []
-        # Search by status (paid or not paid orders)
+            orders = orders.filter(buyer__user__username=request.GET['buyer'])
+        # Search by status (paid, not paid or expired orders)
         if 'status' in request.GET:
             if request.GET['status'] == 'paid':
                 orders = orders.filter(status=True)
-            elif request.get['status'] == 'not_paid':
-                orders = orders.filter(status=False)
+            elif request.GET['status'] == 'not_paid':
+                orders = orders.filter(status=False, expired=False)
+            elif request.GET['status'] == 'expired':
+                orders = orders.filter(status=False, expired=True)
             else:
-                orders = []
+                orders = orders.none()
+        # Filter by purchase time, 'since' is inclusive and 'until' exclusive
+        if 'since' in request.GET:
+            orders = orders.filter(purchase_time__gte=parse_time(request.GET['since']))
+        if 'until' in request.GET:
+            orders = orders.filter(purchase_time__lt=parse_time(request.GET['until']))
+        # Continue after the last order of the previous page
+        cursor = None
+        if 'cursor' in request.GET:
+            cursor = decode_cursor(request.GET['cursor'], 2)
+            cursor = [parse_time(cursor[0]), int(cursor[1])]
+        limit = page_limit(request) if export_format == 'json' else None
+    except (BadRequest, TypeError, ValueError):
+        return bad_request(request, BadRequest)
+
+    # Buyer and seller usernames and game names are joined in the same query
+    orders = orders.values('pk', 'purchase_time', 'buyer__user__username', 'seller__user__username', 'game__name',
+                           'price', 'status', 'expired')
+
+    def serialize(row):
+        return {'pk': row['pk'], 'fields': {
+            'purchase_time': row['purchase_time'],
+            'buyer': row['buyer__user__username'],
+            'seller': row['seller__user__username'],
+            'game': row['game__name'],
+            'price': row['price'],
+            'status': 'paid' if row['status'] else 'expired' if row['expired'] else 'not_paid'
+        }}
+
+    if export_format == 'json':
+        if cursor is not None:
+            orders = orders.filter(keyset_after(ordering, cursor))
+        rows = orders.order_by(*ordering)[:limit + 1].iterator()
+        return json_page_response(rows, limit, serialize,
+                                  lambda row: encode_cursor(row['purchase_time'], row['pk']))
+
+    rows = iter_keyset(orders, ordering, cursor)
+    if export_format == 'ndjson':
+        return ndjson_response(rows, serialize)
+
+    def serialize_csv(row):
+        fields = serialize(row)['fields']
+        return [row['pk']] + [fields[name] for name in SALES_EXPORT_FIELDS[1:]]
+
+    return csv_response(rows, SALES_EXPORT_FIELDS, serialize_csv, 'sales.csv')
+
+
+@read_only
+def rest_sales_rollups(request):
+    """A view for RESTful API for fetching sales totals per day, week or month. Only developers can fetch the totals of
+    their own games. Reads only the daily sales rollups.
+    """
+    # Check if the user is a developer
+    if not request.profile.is_developer:
+        return permission_denied(request, PermissionDenied)
 
-    # Convert buyer and seller ids to usernames and game ids to game names and status to paid/not_paid
-    data = serializers.serialize('json', orders)
-    data_json = json.loads(data)
-    for d in data_json:
-        d['fields']['buyer'] = Player.objects.get(pk=d['fields']['buyer']).user.username
-        d['fields']['seller'] = Developer.objects.get(pk=d['fields']['seller']).user.username
-        d['fields']['game'] = Game.objects.get(pk=d['fields']['game']).name
-        d['fields']['status'] = 'paid' if Order.objects.get(pk=d['pk']).status else 'not_paid'
-        # Remove model information from the returned data
-        d.pop('model')
-    data = json.dumps(data_json)
+    developer_rollups = SalesRollup.objects.filter(seller__user=request.user)
+    period = request.GET.get('period', 'day')
+    try:
+        if period not in rollups.PERIODS:
+            raise BadRequest('Unknown period')
+        # Filter by game name
+        if 'game' in request.GET:
+            developer_rollups = developer_rollups.filter(game__name=request.GET['game'])
+        # Filter by day, 'since' is inclusive and 'until' exclusive
+        if 'since' in request.GET:
+            developer_rollups = developer_rollups.filter(day__gte=parse_time(request.GET['since']).date())
+        if 'until' in request.GET:
+            developer_rollups = developer_rollups.filter(day__lt=parse_time(request.GET['until']).date())
+    except BadRequest:
+        return bad_request(request, BadRequest)
 
-    return render(request, 'rest_sales.html', {'data': data})
+    return JsonResponse(rollups.report(developer_rollups, period), safe=False)
 
 
+@require_POST
+def rest_scores(request):
+    """A view for RESTful API for submitting scores. Takes a JSON body with one score {"game": id, "score": n} or a
+    batch {"scores": [...]}. The scores are validated and queued, and written in batches in the background. Every
+    score takes a token from the player's 'score' bucket of its game (see gamestore.throttle) and scores that are not
+    better than the player's best score of the last SCORE_COALESCE_WINDOW seconds are accepted but not saved.
+    """
+    # Check if the user is a player
+    entitlements = get_entitlements(request)
+    if not entitlements.is_player:
+        return JsonResponse({'error': 'Only players can submit scores'}, status=403)
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        submitted = data['scores'] if 'scores' in data else [data]
+        if not isinstance(submitted, list) or not 0 < len(submitted) <= settings.SCORE_INGEST_MAX_REQUEST:
+            raise BadRequest('Between 1 and {} scores per request'.format(settings.SCORE_INGEST_MAX_REQUEST))
+        catalog = get_catalog()
+        games = [catalog.get(item['game']) for item in submitted]
+        forms = [ScoreForm(data=item) for item in submitted]
+        if not all(form.is_valid() for form in forms):
+            raise BadRequest('Invalid score')
+    except BadRequest as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    except (ValueError, TypeError, KeyError, Game.DoesNotExist):
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    # The player must own the games that are not free
+    if not all(game.price == 0 or entitlements.owns(game.pk) for game in games):
+        return JsonResponse({'error': 'The game is not owned'}, status=403)
+
+    counts = {}
+    for game in games:
+        counts[game.pk] = counts.get(game.pk, 0) + 1
+    capacity = throttle.capacity('score')
+    if capacity is not None and max(counts.values()) > capacity:
+        return JsonResponse({'error': 'At most {} scores of one game per request'.format(capacity)}, status=400)
+    for game_id, count in counts.items():
+        wait = throttle.take('score', request.user.pk, game_id, count)
+        if wait:
+            response = JsonResponse({'error': 'Too many scores, try again later'}, status=429)
+            response['Retry-After'] = str(int(wait) + 1)
+            return response
+
+    player = request.profile.player
+    scores = [HighScore(player=player, game=game, score=form.cleaned_data['score'])
+              for game, form in zip(games, forms)]
+    if not ingest.submit([score for score in scores
+                          if throttle.is_new_best(request.user.pk, score.game_id, score.score)]):
+        return JsonResponse({'error': 'Scores cannot be saved right now'}, status=503)
+    return JsonResponse({'accepted': len(forms)}, status=202)
+
+
+@read_only
+@conditional(lambda request: ['games'])
 def rest_games(request):
-    """A view for RESTful API for fetching game data."""
-    games = Game.objects.all()
+    """A view for RESTful API for fetching game data. The games are read from the catalog snapshot without queries."""
+    games = get_catalog().games
     if request.method == 'GET':
         if 'category' in request.GET:
             # Filter by game category
-            games = games.filter(category=request.GET['category'])
+            games = [game for game in games if game.category == request.GET['category']]
         if 'developer' in request.GET:
             # Filter by developer (username in this case!)
-            if User.objects.filter(username=request.GET['developer']).exists():
-                user = User.objects.get(username=request.GET['developer'])
-                if hasattr(user, 'developer'):
-                    games = games.filter(developer=user.developer)
-                else:
-                    games = []
-            else:
-                games = []
-
-    # Convert developer ids to usernames
-    data = serializers.serialize('json', games)
-    data_json = json.loads(data)
-    for d in data_json:
-        d['fields']['developer'] = Developer.objects.get(pk=d['fields']['developer']).user.username
-        # Remove model information from the returned data
-        d.pop('model')
-    data = json.dumps(data_json)
-
-    return render(request, 'rest_games.html', {'data': data})
+            games = [game for game in games if game.developer.user.username == request.GET['developer']]
+
+    data = [{'pk': game.pk, 'fields': {
+        'name': game.name,
+        'category': game.category,
+        'description': game.description,
+        'game_url': game.game_url,
+        'price': game.price,
+        'developer': game.developer.user.username
+    }} for game in games]
+
+    return JsonResponse(data, safe=False)
+
+
+def metrics(request):
+    """Request metrics in the Prometheus text format. If METRICS_TOKEN is set the scraper must send it as a bearer
+    token.
+    """
+    if settings.METRICS_TOKEN and request.META.get('HTTP_AUTHORIZATION') != 'Bearer ' + settings.METRICS_TOKEN:
+        return HttpResponse(status=401)
+    body, content_type = exposition()
+    return HttpResponse(body, content_type=content_type)
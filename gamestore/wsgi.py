@@ -14,7 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gamestore.settings")
 
 if "DYNO" in os.environ:
-    from dj_static import Cling
-    application = Cling(get_wsgi_application())
+    from gamestore.assets import StaticFiles
+    application = StaticFiles(get_wsgi_application())
 else:
     application = get_wsgi_application()
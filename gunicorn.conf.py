@@ -0,0 +1,24 @@
+# Gunicorn settings, used with 'gunicorn -c gunicorn.conf.py gamestore.wsgi'
+import os
+import shutil
+import tempfile
+
+# The workers write their metrics here and /metrics/ adds them up (see gamestore.metrics)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'gamestore-metrics'))
+
+
+def worker_exit(server, worker):
+    # Write the buffered scores of the worker before it exits
+    from gamestore import ingest
+    ingest.buffer.stop()
+
+
+def on_starting(server):
+    # Metrics of the workers of an earlier run would be added to the new ones
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)